@@ -0,0 +1,23 @@
+"""
+Benchmark the `dump` command end-to-end.
+"""
+import time
+import logging
+import tempfile
+import argparse
+from pathlib import Path
+
+from pyclts.api import CLTS
+from pyclts.__main__ import dump
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        Path(tmp).joinpath('data').mkdir()
+        start = time.time()
+        dump(argparse.Namespace(repos=CLTS(tmp), log=logging.getLogger(__name__)))
+        print('dump: {0:.2f} s'.format(time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
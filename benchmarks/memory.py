@@ -0,0 +1,40 @@
+"""
+Measure the memory used by the sounds of the BIPA system and all sounds generated from the
+graphemes of the transcription datasets.
+"""
+import gc
+import sys
+
+from pyclts import TranscriptionSystem
+from pyclts.api import CLTS
+from pyclts.models import Symbol
+
+
+def sizeof(objects, exclude):
+    """Total size of `objects` and all objects reachable from them, each counted once."""
+    seen, total, stack = {id(o) for o in exclude}, 0, list(objects)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, type):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return total
+
+
+def main():
+    bipa = TranscriptionSystem('bipa')
+    sounds = {id(s): s for s in bipa.sounds.values()}
+    for td in CLTS('.').iter_transcriptiondata(columns=[]):
+        for grapheme in td.sounds:
+            sound = bipa[grapheme]
+            if isinstance(sound, Symbol):
+                sounds[id(sound)] = sound
+    size = sizeof(sounds.values(), [bipa])
+    print('{0} sounds, {1} bytes, {2:.0f} bytes per sound'.format(
+        len(sounds), size, size / len(sounds)))
+
+
+if __name__ == '__main__':
+    main()
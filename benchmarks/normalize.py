@@ -0,0 +1,22 @@
+"""
+Benchmark normalization of the graphemes from transcription datasets.
+"""
+import sys
+import timeit
+
+from pyclts import TranscriptionSystem
+from parse import graphemes
+
+
+def main(datasets, rounds=10):
+    bipa = TranscriptionSystem('bipa')
+    for dataset in datasets:
+        items = graphemes(dataset)
+        timer = timeit.Timer(lambda: [bipa._norm(g) for g in items])
+        best = min(timer.repeat(repeat=rounds, number=10))
+        print('{0}: {1} graphemes, {2:.0f} ns per grapheme'.format(
+            dataset, len(items), best / 10 / len(items) * 1e9))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or ['phoible', 'lapsyd', 'ruhlen'])
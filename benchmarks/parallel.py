@@ -0,0 +1,34 @@
+"""
+Benchmark the throughput of resolving a corpus with different numbers of worker processes.
+"""
+import sys
+import time
+import random
+
+from pyclts import TranscriptionData
+from pyclts.parallel import resolve_corpus
+from pyclts.util import nfd
+
+
+def corpus(size, seed=1):
+    td = TranscriptionData('phoible', columns=[])
+    graphemes = sorted(set(nfd(i['grapheme']) for items in td.data.values() for i in items))
+    rng = random.Random(seed)
+    return [' '.join(rng.choice(graphemes) for _ in range(6)) for _ in range(size)]
+
+
+def main(jobs, size=200000):
+    words = corpus(size)
+    for n in jobs:
+        start, start_cpu = time.time(), time.process_time()
+        for _ in resolve_corpus(words, jobs=n):
+            pass
+        wall, cpu = time.time() - start, time.process_time() - start_cpu
+        # For n > 1, the CPU time of the current process is the serial part of the work,
+        # which bounds the speedup.
+        print('{0} jobs: {1:.0f} words per second, {2:.2f}s CPU in the main process'.format(
+            n, len(words) / wall, cpu))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1, 2, 4])
@@ -0,0 +1,27 @@
+"""
+Benchmark parsing of the graphemes from transcription datasets.
+"""
+import sys
+import timeit
+
+from pyclts import TranscriptionSystem, TranscriptionData
+from pyclts.util import nfd
+
+
+def graphemes(dataset):
+    td = TranscriptionData(dataset)
+    return sorted(set(nfd(item['grapheme']) for items in td.data.values() for item in items))
+
+
+def main(datasets, rounds=10):
+    bipa = TranscriptionSystem('bipa')
+    for dataset in datasets:
+        items = graphemes(dataset)
+        timer = timeit.Timer(lambda: [bipa._parse(g) for g in items])
+        best = min(timer.repeat(repeat=rounds, number=1))
+        print('{0}: {1} graphemes, {2:.2f} µs per grapheme'.format(
+            dataset, len(items), best / len(items) * 1e6))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or ['phoible', 'lapsyd'])
@@ -0,0 +1,28 @@
+"""
+Benchmark pairwise similarities of sounds, computed pair by pair and vectorized.
+"""
+import sys
+import timeit
+
+from pyclts import TranscriptionSystem, TranscriptionData
+
+
+def main(size=1000):
+    bipa = TranscriptionSystem('bipa')
+    sounds = []
+    for name in TranscriptionData('phoible', columns=[]).names:
+        sound = bipa[name]
+        if sound.type in ('consonant', 'vowel', 'tone'):
+            sounds.append(sound)
+        if len(sounds) == size:
+            break
+    pairwise = min(timeit.Timer(
+        lambda: [[s1.similarity(s2) for s2 in sounds] for s1 in sounds]).repeat(3, 1))
+    vectorized = min(timeit.Timer(
+        lambda: bipa.similarity_matrix(sounds, sounds)).repeat(3, 1))
+    print('{0}x{0} sounds: Sound.similarity {1:.3f} s, similarity_matrix {2:.3f} s'.format(
+        len(sounds), pairwise, vectorized))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
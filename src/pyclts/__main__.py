@@ -1,7 +1,11 @@
 """
 Main command line interface to the pyclts package.
 """
+import io
 import sys
+import csv
+import itertools
+import collections
 from collections import defaultdict, Counter
 import json
 from pathlib import Path
@@ -16,30 +20,82 @@ from clldutils.clilib import ArgumentParserWithLogging, command
 from clldutils.markup import Table
 
 from pyclts.transcriptionsystem import TranscriptionSystem
-from pyclts.soundclasses import SOUNDCLASS_SYSTEMS
+from pyclts.soundclasses import SOUNDCLASS_SYSTEMS, write_fallback
 from pyclts.models import is_valid_sound
 from pyclts.util import pkg_path
 from pyclts.api import CLTS
+from pyclts.cache import (
+    write_snapshot, write_generated, verify_generated, write_grapheme_index)
+from pyclts.transcriptiondata import grapheme_index
+from pyclts.parallel import resolve_corpus
+from pyclts import server
+
+# Number of rows written at once by the transcribe command:
+CHUNK_SIZE = 1000
+# Characters which can't be written to TSV fields, replaced by spaces:
+TSV_SPECIAL = {ord(c): ' ' for c in '\t\r\n'}
+
+
+def _resolve(args, with_columns=False):
+    """
+    Resolve the sounds passed to a command, sending them to a daemon if one is running.
+
+    :return: `list` of serialized sounds (see `pyclts.server.sound_as_dict`) or - if \
+    `with_columns` is `True` - a pair (sounds, columns by sound type).
+    """
+    sounds = [s if isinstance(s, str) else s.decode('utf8') for s in args.args]
+    client = server.connect(args.socket)
+    if client:
+        with client:
+            requests = [dict(op='resolve', system=args.system, sounds=sounds)]
+            if with_columns:
+                requests.append(dict(op='columns', system=args.system))
+            responses = client.requests(requests)
+        for response in responses:
+            if 'error' in response:
+                raise ValueError(response['error'])
+        res = [r['result'] for r in responses]
+        return (res[0], collections.OrderedDict(res[1])) if with_columns else res[0]
+
+    tts = TranscriptionSystem(args.system)
+    res = [server.sound_as_dict(tts.get(sound)) for sound in sounds]
+    if with_columns:
+        return res, collections.OrderedDict((t, tts.columns[t]) for t in tts.sound_classes)
+    return res
 
 
 @command()
 def sounds(args):
-    tts = TranscriptionSystem(args.system)
+    """
+    List sounds of a transcription system.
+
+    clts [--system=bipa] [--socket=PATH] sounds SOUND+
+
+    If a daemon is listening at the socket (see "serve"), the sounds are resolved by the
+    daemon.
+    """
     data = []
-    for sound in args.args:
-        sound = tts.get(sound if isinstance(sound, str) else sound.decode('utf8'))
-        if sound.type != 'unknownsound':
-            data += [[str(sound),
-                      sound.source or ' ',
-                      '1' if sound.generated else ' ',
-                      sound.grapheme if sound.alias else ' ',
-                      sound.name]]
+    for sound in _resolve(args):
+        if sound['type'] != 'unknownsound':
+            data += [[sound['s'],
+                      sound['source'] or ' ',
+                      '1' if sound['generated'] else ' ',
+                      sound['grapheme'] if sound['alias'] else ' ',
+                      sound['name']]]
         else:
-            data += [['?', sound.source, '?', '?', '?']]
+            data += [['?', sound['source'], '?', '?', '?']]
     tbl = Table(args.system.upper(), 'SOURCE', 'GENERATED', 'ALIAS', 'NAME', rows=data)
     print(tbl.render(tablefmt=args.format, condensed=False))
 
 
+@command(name='build-cache')
+def build_cache(args):
+    """Write snapshots of all transcription systems and the grapheme index to the cache."""
+    for ts in args.repos.iter_transcriptionsystem():
+        args.log.info('{0} written'.format(write_snapshot(ts)))
+    args.log.info('{0} written'.format(write_grapheme_index(grapheme_index())))
+
+
 @command()
 def _make_package(args):  # pragma: no cover
     """Prepare transcriptiondata from the transcription sources."""
@@ -95,6 +151,29 @@ def _make_package(args):  # pragma: no cover
                 count += 1
     args.log.info('SoundClasses: {0} written to file.'.format(count))
 
+    # precompute the generated sounds for all graphemes in the transcription data
+    strings = set()
+    for td in args.repos.iter_transcriptiondata(columns=[]):
+        strings.update(item['grapheme'] for items in td.data.values() for item in items)
+        strings.update(td.sounds)
+    count = write_generated(bipa, strings)
+    errors = verify_generated(bipa)
+    for string in errors:
+        args.log.error('generated sound does not match parsed sound: {0}'.format(string))
+    if errors:
+        raise ValueError('table of generated sounds could not be verified')
+    args.log.info('Generated sounds: {0} written to file.'.format(count))
+
+    # precompute the sound classes of all known sounds not listed in lingpy.tsv
+    names = set()
+    for td in args.repos.iter_transcriptiondata(columns=[]):
+        names.update(td.names)
+    if args.repos.data_path('sounds.tsv').exists():
+        names.update(row['NAME'] for row in reader(
+            args.repos.data_path('sounds.tsv'), delimiter='\t', dicts=True))
+    args.log.info('SoundClasses: {0} fallback classes written to file.'.format(
+        write_fallback(names)))
+
 
 @command()
 def _make_app_data(args, test=False):
@@ -300,14 +379,8 @@ def dump(args, test=False):
 
 @command()
 def features(args):
-    bipa = TranscriptionSystem(args.system)
-    features = set()
-    for sound in bipa.sounds.values():
-        if sound.type not in ['marker', 'unknownsound']:
-            for k, v in sound.featuredict.items():
-                features.add((sound.type, k, v or ''))
     table = Table('TYPE', 'FEATURE', 'VALUE')
-    table.extend(sorted(features))
+    table.extend(TranscriptionSystem(args.system).feature_values())
     print(table.render(tablefmt='simple'))
 
 
@@ -315,7 +388,7 @@ def features(args):
 def dstats(args):
     table = [['id', 'valid', 'total', 'percent']]
     bipa = TranscriptionSystem('bipa')
-    for td in args.repos.iter_transcriptiondata():
+    for td in args.repos.iter_transcriptiondata(columns=[]):
         ln = [1 if is_valid_sound(bipa[name], bipa) else 0 for name in td.names]
         table += [[
             td.id,
@@ -327,6 +400,24 @@ def dstats(args):
     print(tabulate.tabulate(table, headers='firstrow'))
 
 
+@command()
+def coverage(args):
+    """
+    Print the share of the sounds of each transcription dataset (rows) which is covered by
+    the other datasets (columns).
+    """
+    from pyclts.soundids import SoundIDs, overlap_matrix
+
+    tds = list(args.repos.iter_transcriptiondata(columns=[]))
+    overlap = overlap_matrix(SoundIDs('bipa').encode_inventories(
+        [name for name in td.names if name != '<NA>'] for td in tds))
+    table = [['id'] + [td.id for td in tds]]
+    for i, td in enumerate(tds):
+        table.append([td.id] + [
+            overlap[i, j] / overlap[i, i] if overlap[i, i] else 0 for j in range(len(tds))])
+    print(tabulate.tabulate(table, headers='firstrow', floatfmt='.2f'))
+
+
 @command()
 def stats(args):
     sounds = {}
@@ -357,30 +448,36 @@ def stats(args):
 
 @command()
 def table(args):
-    tts = TranscriptionSystem(args.system)
-    tts_sounds = [tts.get(sound if isinstance(sound, str) else sound.decode('utf8'))
-                  for sound in args.args]
+    """
+    Tabulate sounds of a transcription system by type.
+
+    clts [--system=bipa] [--socket=PATH] [--filter=generated|unknown|known] table SOUND+
+
+    If a daemon is listening at the socket (see "serve"), the sounds are resolved by the
+    daemon.
+    """
+    tts_sounds, columns = _resolve(args, with_columns=True)
     if args.filter == 'generated':
-        tts_sounds = [s for s in tts_sounds if s.generated]
+        tts_sounds = [s for s in tts_sounds if s['generated']]
     elif args.filter == 'unknown':
-        tts_sounds = [s for s in tts_sounds if s.type == 'unknownsound']
+        tts_sounds = [s for s in tts_sounds if s['type'] == 'unknownsound']
     elif args.filter == 'known':
         tts_sounds = [s for s in tts_sounds if
-                      not s.generated and not s.type == 'unknownsound']
+                      not s['generated'] and not s['type'] == 'unknownsound']
 
     data = defaultdict(list)
     ucount = 0
     for sound in tts_sounds:
-        if sound.type != 'unknownsound':
-            data[sound.type] += [sound.table]
+        if sound['type'] != 'unknownsound':
+            data[sound['type']] += [sound['table']]
         else:
             ucount += 1
             data['unknownsound'].append(
-                [str(ucount), sound.source or '', sound.grapheme])
-    for cls in tts.sound_classes:
+                [str(ucount), sound['source'] or '', sound['grapheme']])
+    for cls in columns:
         if cls in data:
             print('# {0}\n'.format(cls))
-            tbl = Table(*[c.upper() for c in tts.columns[cls]], rows=data[cls])
+            tbl = Table(*[c.upper() for c in columns[cls]], rows=data[cls])
             print(tbl.render(tablefmt=args.format, condensed=False))
             print('')
     if data['unknownsound']:
@@ -389,6 +486,106 @@ def table(args):
         print(tbl.render(tablefmt=args.format, condensed=False))
 
 
+@command()
+def transcribe(args):
+    """
+    Transcribe the segments of a TSV or CSV file into a transcription system.
+
+    clts [--system=bipa] [--column=Segments] [--output=tsv|csv|jsonl] [--jobs=N] \\
+        transcribe [FILE]
+
+    Rows are read from FILE - or from stdin, if no FILE or "-" is given - and written to
+    stdout one by one, amended with the graphemes, names and unknown flags of the segments
+    in the column. Files with suffix .csv are read as CSV, everything else as TSV - where
+    quotes are not special. Rows without the column - e.g. blank lines - are written with
+    empty results. With --jobs=N, the segments are resolved by N worker processes.
+    """
+    fname = args.args[0] if args.args else '-'
+    if fname == '-':
+        infile, delimiter = sys.stdin, '\t'
+    else:
+        infile = io.open(fname, encoding='utf8', newline='', buffering=2 ** 20)
+        delimiter = ',' if Path(fname).suffix.lower() == '.csv' else '\t'
+
+    try:
+        if delimiter == '\t':
+            # Quotes have no special meaning in TSV:
+            rows = csv.reader(infile, delimiter='\t', quoting=csv.QUOTE_NONE)
+        else:
+            rows = csv.reader(infile)
+        header = next(rows, None)
+        if header is None:
+            return
+        if args.column not in header:
+            raise ValueError('column {0} not found'.format(args.column))
+        index = header.index(args.column)
+
+        chunk = io.StringIO()
+        if args.output == 'jsonl':
+            def write(row):
+                chunk.write(json.dumps(row, ensure_ascii=False) + '\n')
+        elif args.output == 'csv':
+            write = csv.writer(chunk, lineterminator='\n').writerow
+        else:
+            writer = csv.writer(
+                chunk,
+                delimiter='\t',
+                quoting=csv.QUOTE_NONE,
+                quotechar=None,
+                lineterminator='\n')
+
+            def write(row):
+                writer.writerow([field.translate(TSV_SPECIAL) for field in row])
+        if args.output != 'jsonl':
+            write(header + ['CLTS_GRAPHEMES', 'CLTS_NAMES', 'CLTS_UNKNOWN'])
+
+        # The rows are consumed twice - for resolution and output - but the resolved
+        # words lag behind only by the chunks being processed:
+        rows, segments = itertools.tee(rows)
+        words = resolve_corpus(
+            (row[index] if index < len(row) else '' for row in segments),
+            system=args.system,
+            jobs=args.jobs)
+        for i, (row, word) in enumerate(zip(rows, words)):
+            graphemes = [grapheme for grapheme, _, _ in word]
+            names = [name or '?' for _, name, _ in word]
+            unknown = [flag for _, _, flag in word]
+            if args.output == 'jsonl':
+                item = dict(zip(header, row))
+                item.update(CLTS_GRAPHEMES=graphemes, CLTS_NAMES=names, CLTS_UNKNOWN=unknown)
+                write(item)
+            else:
+                write(row + [
+                    ' '.join(graphemes),
+                    ' / '.join(names),
+                    ' '.join('1' if u else '0' for u in unknown)])
+            if (i + 1) % CHUNK_SIZE == 0:
+                sys.stdout.write(chunk.getvalue())
+                chunk.seek(0)
+                chunk.truncate()
+        sys.stdout.write(chunk.getvalue())
+        sys.stdout.flush()
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+
+
+@command()
+def serve(args):  # pragma: no cover
+    """
+    Run a daemon answering requests of local clients, see `pyclts.server`.
+
+    clts [--system=bipa] [--data=phoible] [--socket=PATH] serve
+
+    The transcription system, all sound class models and the transcription data are kept
+    loaded. The daemon runs until it is interrupted.
+    """
+    path = args.socket or server.socket_path()
+    resolver = server.Resolver(systems=[args.system], data=[args.data])
+    args.log.info('listening at {0}'.format(path))
+    server.serve(path, resolver=resolver)
+
+
 def main(args=None):  # pragma: no cover
     parser = ArgumentParserWithLogging('pyclts')
     parser.add_argument(
@@ -412,6 +609,21 @@ def main(args=None):  # pragma: no cover
     parser.add_argument(
         '--system', help="specify the transcription system you want to load",
         default="bipa")
+    parser.add_argument(
+        '--column', help="name of the column with segments to transcribe",
+        default="Segments")
+    parser.add_argument(
+        '--output', help="output format of the transcribe command",
+        choices=['tsv', 'csv', 'jsonl'],
+        default="tsv")
+    parser.add_argument(
+        '--jobs', help="number of worker processes used by the transcribe command",
+        type=int,
+        default=1)
+    parser.add_argument(
+        '--socket', help="path of the socket of the daemon (default: $PYCLTS_SOCKET or "
+                         "pyclts.sock in the cache directory)",
+        default=None)
 
     res = parser.main(args=args)
     if args is None:  # pragma: no cover
@@ -21,9 +21,9 @@ class CLTS(API):
                 if graphemesp.exists():
                     yield src, list(reader(graphemesp, dicts=True, delimiter='\t'))
 
-    def iter_transcriptiondata(self):
+    def iter_transcriptiondata(self, columns=None):
         for td in sorted(pkg_path('transcriptiondata').iterdir(), key=lambda p: p.name):
-            yield TranscriptionData(td.stem)
+            yield TranscriptionData(td.stem, columns=columns)
 
     def iter_soundclass(self):
         for sc in SOUNDCLASS_SYSTEMS:
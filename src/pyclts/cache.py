@@ -0,0 +1,365 @@
+"""
+On-disk caching of transcription system data.
+
+A snapshot stores the fully initialized state of a `TranscriptionSystem`, i.e. the
+sounds, feature and diacritic lookups, so that loading a system does not require
+re-parsing the csvw tables. Snapshots are keyed by the package version and a content
+hash of the data (and code) they were created from; a snapshot which doesn't match the
+current data is simply ignored.
+
+The index of the graphemes of all transcription datasets is cached in the same way.
+
+In addition, the package ships tables of precomputed generated sounds, i.e. the sounds
+generated from the graphemes of the transcription data, see `write_generated`.
+"""
+import io
+import os
+import json
+import pickle
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+
+import attr
+from csvw.dsv import UnicodeWriter, reader
+
+from pyclts.util import pkg_path, nfd
+from pyclts.models import UnknownSound
+
+__all__ = [
+    'cache_dir', 'system_hash', 'snapshot_path', 'write_snapshot', 'load_snapshot',
+    'ParseCache', 'generated_path', 'write_generated', 'load_generated',
+    'verify_generated', 'write_grapheme_index', 'load_grapheme_index']
+
+# Increment when the layout of the pickled state changes:
+SNAPSHOT_FORMAT = 3
+# Attributes of a TranscriptionSystem which are not stored in a snapshot:
+EXCLUDE_ATTRIBUTES = {
+    'id', 'system', 'cache_size', '_cache', '_parse_cache', '_sounds', '_generated',
+    '_nearest', '_translation_tables', '_lock'}
+
+# Types of sounds which are stored in a table of generated sounds:
+GENERATED_TYPES = {'consonant', 'vowel', 'tone'}
+# First line of a table of generated sounds, followed by the content hash of the system:
+GENERATED_HASH_PREFIX = '# system_hash: '
+# Attributes of generated sounds which are not copied from the base sound or diacritics:
+GENERATED_ATTRIBUTES = {
+    'ts', 'grapheme', 'source', 'generated', 'normalized', 'base', 'alias'}
+
+# Types of symbols which are stored in a ParseCache:
+PARSE_CACHE_TYPES = {'consonant', 'vowel', 'tone', 'unknownsound'}
+
+
+def cache_dir():
+    """
+    Directory to store cached data in.
+
+    Defaults to `~/.cache/pyclts` and can be overridden by setting the environment
+    variable `PYCLTS_CACHE_DIR`.
+    """
+    return Path(os.environ.get('PYCLTS_CACHE_DIR') or Path.home() / '.cache' / 'pyclts')
+
+
+def data_hash(*paths):
+    """Compute a SHA256 content hash over a sequence of files."""
+    sha = hashlib.sha256()
+    for path in paths:
+        sha.update(path.name.encode('utf8'))
+        with path.open('rb') as fp:
+            sha.update(fp.read())
+    return sha.hexdigest()
+
+
+def system_hash(id_):
+    """Content hash over all data (and code) a transcription system is built from."""
+    return data_hash(*[
+        pkg_path('transcriptionsystems', 'transcription-system-metadata.json'),
+        pkg_path('transcriptionsystems', 'features.json'),
+        pkg_path('models.py'),
+        pkg_path('transcriptionsystem.py')] + sorted(
+            pkg_path('transcriptionsystems', id_).glob('*.tsv'), key=lambda p: p.name))
+
+
+def snapshot_path(id_):
+    return cache_dir() / '{0}.pickle'.format(id_)
+
+
+def _snapshot_key(id_):
+    from pyclts import __version__
+
+    return SNAPSHOT_FORMAT, __version__, system_hash(id_)
+
+
+class _Pickler(pickle.Pickler):
+    """
+    Sounds refer back to their transcription system, so we pickle this reference as
+    persistent ID, to be resolved when loading a snapshot into an instance.
+    """
+    def __init__(self, fp, ts):
+        pickle.Pickler.__init__(self, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        self.ts = ts
+
+    def persistent_id(self, obj):
+        return 'ts' if obj is self.ts else None
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, fp, ts):
+        pickle.Unpickler.__init__(self, fp)
+        self.ts = ts
+
+    def persistent_load(self, pid):
+        if pid != 'ts':  # pragma: no cover
+            raise pickle.UnpicklingError('unsupported persistent id: {0}'.format(pid))
+        return self.ts
+
+
+def write_snapshot(ts):
+    """
+    Write a snapshot of an initialized transcription system to the cache directory.
+
+    :return: Path of the snapshot file.
+    """
+    path = snapshot_path(ts.id)
+    if not path.parent.exists():
+        path.parent.mkdir(parents=True)
+    state = {k: v for k, v in vars(ts).items() if k not in EXCLUDE_ATTRIBUTES}
+    tmp = path.parent / '{0}.{1}.tmp'.format(path.name, os.getpid())
+    with tmp.open('wb') as fp:
+        pickle.dump(_snapshot_key(ts.id), fp, protocol=pickle.HIGHEST_PROTOCOL)
+        _Pickler(fp, ts).dump(state)
+    # Replacing the file atomically makes sure concurrent readers never see partial data.
+    os.replace(str(tmp), str(path))
+    return path
+
+
+def load_snapshot(ts, id_):
+    """
+    Initialize `ts` from a snapshot of transcription system `id_`.
+
+    :return: `True` if a matching snapshot was found and loaded, `False` otherwise.
+    """
+    path = snapshot_path(id_)
+    if not path.exists():
+        return False
+    try:
+        with path.open('rb') as fp:
+            if pickle.load(fp) != _snapshot_key(id_):
+                return False
+            state = _Unpickler(fp, ts).load()
+    except Exception:  # pragma: no cover
+        # A corrupt or incompatible snapshot is no reason to fail - we just fall back
+        # to loading the system from the data.
+        return False
+    ts.__dict__.update(state)
+    return True
+
+
+def grapheme_index_path():
+    return cache_dir() / 'graphemes.pickle'
+
+
+def _grapheme_index_key():
+    from pyclts import __version__
+
+    return SNAPSHOT_FORMAT, __version__, data_hash(*sorted(
+        pkg_path('transcriptiondata').glob('*.tsv'), key=lambda p: p.name))
+
+
+def write_grapheme_index(index):
+    """
+    Write the index of the graphemes of all transcription datasets to the cache directory.
+    """
+    path = grapheme_index_path()
+    if not path.parent.exists():
+        path.parent.mkdir(parents=True)
+    tmp = path.parent / '{0}.{1}.tmp'.format(path.name, os.getpid())
+    with tmp.open('wb') as fp:
+        pickle.dump(_grapheme_index_key(), fp, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(index, fp, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(str(tmp), str(path))
+    return path
+
+
+def load_grapheme_index():
+    """
+    :return: The cached index of graphemes or `None`, if there's no matching index.
+    """
+    path = grapheme_index_path()
+    if not path.exists():
+        return None
+    try:
+        with path.open('rb') as fp:
+            if pickle.load(fp) != _grapheme_index_key():
+                return None
+            return pickle.load(fp)
+    except Exception:  # pragma: no cover
+        return None
+
+
+class ParseCache(object):
+    """
+    A persistent store for sounds parsed by transcription systems, backed by SQLite.
+
+    The store can be shared by many processes. Entries are keyed by system ID, the
+    content hash of the system and the (NFD normalized) input string, thus changes of the
+    system data invalidate the entries automatically.
+
+    Only sounds which are costly to compute and can be restored exactly are stored, i.e.
+    generated consonants, vowels and tones and unknown sounds.
+    """
+    def __init__(self, path=None):
+        self.path = Path(path) if path else cache_dir() / 'parses.sqlite'
+        self._hashes = {}
+        self._local = threading.local()
+
+    @property
+    def _connection(self):
+        # SQLite connections must not be shared between threads or processes.
+        if getattr(self._local, 'pid', None) != os.getpid():
+            if not self.path.parent.exists():
+                self.path.parent.mkdir(parents=True)
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Losing the last entries on a crash is no problem for a cache:
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute("""\
+CREATE TABLE IF NOT EXISTS sounds (
+    system TEXT,
+    hash TEXT,
+    input TEXT,
+    type TEXT,
+    name TEXT,
+    grapheme TEXT,
+    attributes TEXT,
+    PRIMARY KEY (system, hash, input)
+)""")
+            conn.commit()
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return self._local.conn
+
+    def _key(self, ts, string):
+        if ts.id not in self._hashes:
+            self._hashes[ts.id] = system_hash(ts.id)
+        return ts.id, self._hashes[ts.id], string
+
+    def get(self, ts, string):
+        """
+        Retrieve the sound for `string` in system `ts`.
+
+        :return: `Symbol` instance or `None` if the cache has no matching entry.
+        """
+        row = self._connection.execute(
+            'SELECT type, attributes FROM sounds WHERE system = ? AND hash = ? AND input = ?',
+            self._key(ts, string)).fetchone()
+        if row:
+            type_, attributes = row
+            cls = UnknownSound if type_ == 'unknownsound' else ts.sound_classes[type_]
+            return cls(ts=ts, **json.loads(attributes))
+
+    def add(self, ts, string, sound):
+        """
+        Store the sound parsed from `string` in system `ts`.
+
+        :return: `bool` signaling whether the sound was stored.
+        """
+        if sound.type not in PARSE_CACHE_TYPES:
+            return False
+        attributes = attr.asdict(
+            sound, recurse=False, filter=lambda a, v: a.init and a.name != 'ts')
+        with self._connection as conn:
+            conn.execute(
+                'INSERT OR IGNORE INTO sounds VALUES (?, ?, ?, ?, ?, ?, ?)',
+                self._key(ts, string) + (
+                    sound.type, sound.name, str(sound), json.dumps(attributes)))
+        return True
+
+    def clear(self):
+        with self._connection as conn:
+            conn.execute('DELETE FROM sounds')
+
+
+def generated_path(id_):
+    return pkg_path('generated', '{0}.tsv'.format(id_))
+
+
+def write_generated(ts, strings):
+    """
+    Write the table of precomputed generated sounds of a transcription system.
+
+    A generated sound is stored as its base grapheme, its canonical grapheme and the
+    feature values added by the diacritics, thus it can be restored without parsing, see
+    `TranscriptionSystem._generated_sound`. The first line of the table holds the content
+    hash of the system, so that outdated tables are ignored.
+
+    :param strings: The strings to be parsed; only the generated consonants, vowels and \
+    tones are stored.
+    :return: Number of sounds written to the table.
+    """
+    rows = []
+    for string in sorted(set(nfd(s) for s in strings)):
+        if string in ts.sounds:
+            continue
+        sound = ts._parse(string)
+        if not (sound.generated and sound.type in GENERATED_TYPES):
+            continue
+        base = ts.sounds[sound.base]
+        features = [
+            getattr(sound, a.name) for a in attr.fields(type(sound))
+            if a.init and a.name not in GENERATED_ATTRIBUTES
+            if getattr(sound, a.name) != getattr(base, a.name)]
+        rows.append([
+            string,
+            sound.base,
+            sound.grapheme,
+            ' '.join(features),
+            '+' if sound.alias != base.alias else '',
+            '+' if sound.normalized else ''])
+
+    path = generated_path(ts.id)
+    if not path.parent.exists():
+        path.parent.mkdir(parents=True)
+    with io.open(str(path), 'w', encoding='utf8', newline='') as fp:
+        fp.write('{0}{1}\n'.format(GENERATED_HASH_PREFIX, system_hash(ts.id)))
+        with UnicodeWriter(fp, delimiter='\t') as writer:
+            writer.writerow(['INPUT', 'BASE', 'GRAPHEME', 'FEATURES', 'ALIAS', 'NORMALIZED'])
+            writer.writerows(rows)
+    return len(rows)
+
+
+def load_generated(id_):
+    """
+    Read the table of precomputed generated sounds of a transcription system.
+
+    :return: `dict` mapping input strings to the rows of the table - or an empty `dict` if \
+    there's no table or the table doesn't match the current data of the system.
+    """
+    path = generated_path(id_)
+    if not path.exists():
+        return {}
+    with io.open(str(path), encoding='utf8', newline='') as fp:
+        if fp.readline().rstrip('\r\n') != GENERATED_HASH_PREFIX + system_hash(id_):
+            return {}
+        rows = reader(fp, delimiter='\t')
+        next(rows)
+        return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def verify_generated(ts):
+    """
+    Check whether the generated sounds in the table match the sounds parsed by `ts`.
+
+    :return: `list` of input strings for which the table is out of date.
+    """
+    def asdict(sound):
+        return attr.asdict(sound, recurse=False, filter=lambda a, v: a.init)
+
+    # Make sure we check the table as it is on disk:
+    ts._generated = load_generated(ts.id)
+    res = []
+    for string in ts._generated:
+        sound = ts._generated_sound(string)
+        if sound is None or asdict(sound) != asdict(ts._parse(string)):
+            res.append(string)
+    return res
@@ -1,7 +1,8 @@
+import functools
 import unicodedata
 
 import attr
-from clldutils.misc import nfilter, lazyproperty
+from clldutils.misc import nfilter
 
 from pyclts.util import norm
 
@@ -34,6 +35,27 @@ EXCLUDE_FEATURES = [
 ]
 
 
+def cached(func):
+    """
+    Decorator turning a method into a property whose value is computed only once.
+
+    Since sounds are immutable and don't have an instance `__dict__`, the value is stored in
+    the attribute named like the method, prefixed with an underscore, which must be declared
+    as `attr.ib(default=None, init=False)`. Thus copies created with `attr.evolve` compute
+    the value anew.
+    """
+    slot = '_' + func.__name__
+
+    @functools.wraps(func)
+    def wrapper(self):
+        value = getattr(self, slot)
+        if value is None:
+            value = func(self)
+            object.__setattr__(self, slot, value)
+        return value
+    return property(wrapper)
+
+
 def is_valid_sound(sound, ts):
     """Check the consistency of a given transcription system conversino"""
     if isinstance(sound, (Marker, UnknownSound)):
@@ -43,7 +65,7 @@ def is_valid_sound(sound, ts):
     return s1.name == s2.name and s1.s == s2.s
 
 
-@attr.s(cmp=False)
+@attr.s(cmp=False, frozen=True, slots=True)
 class Symbol(object):
     ts = attr.ib()
     grapheme = attr.ib()
@@ -51,7 +73,7 @@ class Symbol(object):
     generated = attr.ib(default=False, validator=attr.validators.instance_of(bool))
     note = attr.ib(default=None)
 
-    @lazyproperty
+    @property
     def type(self):
         return self.__class__.__name__.lower()
 
@@ -85,21 +107,28 @@ class Symbol(object):
         return ' '.join('U+' + ('000' + hex(ord(x))[2:])[-4:] for x in str(self))
 
 
-@attr.s(cmp=False)
+@attr.s(cmp=False, frozen=True, slots=True)
 class UnknownSound(Symbol):
     pass
 
 
-@attr.s(cmp=False, repr=False)
+@attr.s(cmp=False, repr=False, frozen=True, slots=True)
 class Sound(Symbol):
     """
     Sound object stores basic features of the individual sound objects.
+
+    Sounds are immutable, thus derived values - name, feature set and reference
+    representation - are computed only once.
     """
     base = attr.ib(default=None)
     alias = attr.ib(default=None)
     normalized = attr.ib(default=None)
     unknown = attr.ib(default=None)
     stress = attr.ib(default=None)
+    # cached values, see `cached`:
+    _name = attr.ib(default=None, init=False, repr=False)
+    _featureset = attr.ib(default=None, init=False, repr=False)
+    _s = attr.ib(default=None, init=False, repr=False)
 
     _name_order = []
     _write_order = dict(pre=[], post=[])
@@ -117,12 +146,10 @@ class Sound(Symbol):
         return str(self) + str(other)
 
     def __hash__(self):
+        # Hashes of strings differ between processes, thus must not be stored on sounds,
+        # which end up in snapshots. Since the name is cached, so is its hash.
         return hash(self.name)
 
-    @property
-    def s(self):
-        return str(self)
-
     def _features(self):
         return nfilter(getattr(self, p, None) for p in self._name_order)
 
@@ -130,7 +157,7 @@ class Sound(Symbol):
     def featuredict(self):
         return {f: getattr(self, f, None) for f in self._name_order}
 
-    @property
+    @cached
     def featureset(self):
         return frozenset(self._features() + [self.type])
 
@@ -147,6 +174,10 @@ class Sound(Symbol):
         We first try to return the non-alias value in our data. If this fails,
         we create the sound based on it's feature representation.
         """
+        return self.s
+
+    @cached
+    def s(self):
         # generated sounds need to be re-produced for double-checking
         if not self.generated:
             if not self.alias and self.grapheme in self.ts.sounds:
@@ -158,32 +189,23 @@ class Sound(Symbol):
                 'Orphaned alias {0}'.format(self.grapheme))  # pragma: no cover
 
         # search for best base-string
-        elements = [f for f in self._features() if f not in EXCLUDE_FEATURES] + [self.type]
-        base_str = self.base or '<?>'
-        base_graphemes = []
-        while elements:
-            base = self.ts.features.get(frozenset(elements))
-            if base:
-                base_graphemes.append(base.grapheme)
-            elements.pop(0)
-        base_str = base_graphemes[-1] if base_graphemes else base_str or '<?>'
-        base_vals = {
-            self.ts._feature_values[elm] for elm in
-            self.ts.sounds[base_str].name.split(' ')[:-1]} if \
-            base_str != '<?>' else {}
+        features = self._features()
+        base_str, base_vals = self.ts._base_grapheme(
+            tuple(f for f in features if f not in EXCLUDE_FEATURES) + (self.type,),
+            self.base)
         out = []
         for p in self._write_order['pre']:
-            if p not in base_vals and getattr(self, p, '') in self._features():
-                out.append(
-                    norm(self.ts.features[self.type].get(getattr(self, p, ''), '<!>')))
+            value = getattr(self, p, None)
+            if p not in base_vals and value in features:
+                out.append(norm(self.ts.features[self.type].get(value, '<!>')))
         out.append(base_str)
         for p in self._write_order['post']:
-            if p not in base_vals and getattr(self, p, '') in self._features():
-                out.append(
-                    norm(self.ts.features[self.type].get(getattr(self, p, ''), '<!>')))
+            value = getattr(self, p, None)
+            if p not in base_vals and value in features:
+                out.append(norm(self.ts.features[self.type].get(value, '<!>')))
         return ''.join(out)
 
-    @property
+    @cached
     def name(self):
         return ' '.join([f or '' for f in self._features()] + [self.type])
 
@@ -214,9 +236,10 @@ class Sound(Symbol):
         return tbl
 
 
-@attr.s(cmp=False)
+@attr.s(cmp=False, frozen=True, slots=True)
 class Marker(Symbol):
     alias = attr.ib(default=None)
+    normalized = attr.ib(default=None)
     feature = attr.ib(default=None)
     value = attr.ib(default=None)
     unknown = attr.ib(default=None)
@@ -230,7 +253,7 @@ class Marker(Symbol):
         return frozenset([self.grapheme, self.type])
 
 
-@attr.s(cmp=False, repr=False)
+@attr.s(cmp=False, repr=False, frozen=True, slots=True)
 class Consonant(Sound):
 
     # features follow basic information about IPA from various sources, they
@@ -281,15 +304,16 @@ class Consonant(Sound):
         'sibilancy', 'manner']
 
 
-@attr.s(cmp=False, repr=False)
+@attr.s(cmp=False, repr=False, frozen=True, slots=True)
 class ComplexSound(Sound):
     from_sound = attr.ib(default=None)
     to_sound = attr.ib(default=None)
 
-    def __str__(self):
+    @cached
+    def s(self):
         return str(self.from_sound) + str(self.to_sound)
 
-    @property
+    @cached
     def name(self):
         n1 = ' '.join(self.from_sound.name.split(' ')[:-1])
         n2 = ' '.join(self.to_sound.name.split(' ')[:-1])
@@ -313,7 +337,7 @@ class ComplexSound(Sound):
         return [self.grapheme, self.from_sound.name, self.to_sound.name]
 
 
-@attr.s(cmp=False, repr=False)
+@attr.s(cmp=False, repr=False, frozen=True, slots=True)
 class Cluster(ComplexSound):
     """
     A cluster of two consonants whose manner is either plosive or implosive.
@@ -326,7 +350,7 @@ class Cluster(ComplexSound):
     """
 
 
-@attr.s(cmp=False, repr=False)
+@attr.s(cmp=False, repr=False, frozen=True, slots=True)
 class Vowel(Sound):
     roundedness = attr.ib(default=None)
     height = attr.ib(default=None)
@@ -369,14 +393,14 @@ class Vowel(Sound):
         'tone']
 
 
-@attr.s(cmp=False, repr=False)
+@attr.s(cmp=False, repr=False, frozen=True, slots=True)
 class Diphthong(ComplexSound):
     """
     A dipthong consists of two vowels.
     """
 
 
-@attr.s(cmp=False, repr=False)
+@attr.s(cmp=False, repr=False, frozen=True, slots=True)
 class Tone(Sound):
     contour = attr.ib(default=None)
     start = attr.ib(default=None)
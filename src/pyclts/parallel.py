@@ -0,0 +1,95 @@
+"""
+Resolution of large corpora with a pool of worker processes.
+
+Each worker loads the transcription system once, when it is started. The corpus is split
+into chunks of words, which are sent to the workers as they are, i.e. the workers split
+the words, resolve the distinct segments of a chunk and return the resolved words. Thus,
+the work done by the current process - which limits the speedup - is small. Results are
+returned in the order of the input words, and the number of chunks being processed at the
+same time is limited, so corpora of any size can be streamed.
+"""
+import os
+import itertools
+import collections
+import multiprocessing
+
+from pyclts.transcriptionsystem import TranscriptionSystem
+
+__all__ = ['resolve_corpus']
+
+# Number of words sent to a worker at once:
+CHUNK_SIZE = 1000
+
+# The transcription system of a worker process:
+_system = None
+
+
+def _init_worker(system):
+    global _system
+    _system = TranscriptionSystem(system)
+
+
+def _resolve(ts, words):
+    """
+    Resolve a chunk of words.
+
+    :return: `list` of resolved words, i.e. lists of triples (grapheme, name, unknown flag).
+    """
+    words = [word.split() if isinstance(word, str) else list(word) for word in words]
+    results = {}
+    for segment in dict.fromkeys(segment for word in words for segment in word):
+        try:
+            sound = ts[segment]
+        except (KeyError, ValueError):
+            # Segments looking like - invalid - sound names raise a ValueError.
+            results[segment] = (segment, None, True)
+            continue
+        results[segment] = (str(sound), sound.name, sound.type == 'unknownsound')
+    # Results of the same segment are the same object, which is pickled only once:
+    return [[results[segment] for segment in word] for word in words]
+
+
+def _resolve_chunk(words):
+    return _resolve(_system, words)
+
+
+def _chunks(words, chunk_size):
+    words = iter(words)
+    while True:
+        chunk = list(itertools.islice(words, chunk_size))
+        if not chunk:
+            break
+        yield chunk
+
+
+def resolve_corpus(words, system='bipa', jobs=None, chunk_size=CHUNK_SIZE):
+    """
+    Resolve the segments of a corpus in parallel.
+
+    :param words: Iterable of words, given as strings of whitespace separated segments or \
+    sequences of segments (strings).
+    :param system: ID of a transcription system.
+    :param jobs: Number of worker processes; defaults to the number of CPUs. With `1`, \
+    the corpus is resolved in the current process.
+    :return: Generator of resolved words, i.e. lists of triples (grapheme, name, unknown \
+    flag) in the order of `words`.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    # Loading the system here makes sure it exists, and forked workers inherit it.
+    ts = TranscriptionSystem(system)
+    if jobs == 1:
+        for chunk in _chunks(words, chunk_size):
+            yield from _resolve(ts, chunk)
+        return
+
+    # The current process only reads chunks of words and passes on the results; splitting
+    # words and resolving their segments is done by the workers.
+    with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(system,)) as pool:
+        pending = collections.deque()
+        for chunk in _chunks(words, chunk_size):
+            pending.append(pool.apply_async(_resolve_chunk, (chunk,)))
+            # Keep all workers busy, but don't read ahead more than necessary:
+            if len(pending) > 2 * jobs:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
@@ -0,0 +1,299 @@
+"""
+A resolver daemon, answering requests of local clients over a Unix socket.
+
+The daemon keeps transcription systems, sound classes and transcription data loaded, thus
+clients - e.g. the `sounds` and `table` commands of the CLI - don't pay for loading them.
+
+Requests and responses are JSON objects, sent as one line each. Requests have an `op`
+and - optionally - an `id`, which is copied into the response:
+
+- `{"op": "resolve", "system": "bipa", "sounds": ["a", "kh"]}`: Properties of the sounds,
+  see `sound_as_dict`.
+- `{"op": "translate", "system": "bipa", "target": "asjp", "kind": "soundclasses",
+  "words": ["t a"]}`: Words translated into a transcription system (`kind` "system", the
+  default), sound class model ("soundclasses") or transcription data ("data"), with
+  `null` for sounds which can't be translated. With `"nearest": true`, missing sounds are
+  translated to the most similar sound of a target system.
+- `{"op": "soundclass", "model": "sca", "sounds": ["a", "kh"]}`: Sound classes of the
+  sounds, with `"0"` (or the value of `default`) for sounds without class.
+- `{"op": "columns", "system": "bipa"}`: Pairs (sound type, columns of the tabular
+  representation of sounds of the type).
+- `{"op": "batch", "requests": [...]}`: A list of responses.
+
+Responses hold the `result` of the request or an `error` message.
+
+Requests received together are handled as one batch, i.e. the sounds of all resolve
+requests for a system are resolved once, and the responses are sent at once. Thus,
+clients with many requests should send them without waiting for responses, see
+`Client.requests`.
+"""
+import os
+import sys
+import json
+import signal
+import socket
+import socketserver
+import collections
+
+from pyclts.util import registry
+from pyclts.transcriptionsystem import TranscriptionSystem
+from pyclts.soundclasses import SoundClasses, SOUNDCLASS_SYSTEMS
+from pyclts.transcriptiondata import TranscriptionData
+from pyclts.cache import cache_dir
+
+__all__ = [
+    'socket_path', 'sound_as_dict', 'Resolver', 'make_server', 'serve', 'Client', 'connect']
+
+# Number of bytes read from a socket at once:
+BUFFER_SIZE = 2 ** 16
+KINDS = {'system': TranscriptionSystem, 'soundclasses': SoundClasses, 'data': TranscriptionData}
+
+
+def socket_path():
+    """
+    Default path of the socket of the daemon.
+
+    Defaults to `pyclts.sock` in the cache directory and can be overridden by setting the
+    environment variable `PYCLTS_SOCKET`.
+    """
+    return os.environ.get('PYCLTS_SOCKET') or str(cache_dir() / 'pyclts.sock')
+
+
+def sound_as_dict(sound):
+    """
+    Serialize the properties of a resolved sound which are reported by the CLI.
+    """
+    unknown = sound.type == 'unknownsound'
+    return dict(
+        s=str(sound),
+        grapheme=sound.grapheme,
+        source=sound.source,
+        type=sound.type,
+        name=sound.name,
+        generated=bool(sound.generated),
+        alias=bool(getattr(sound, 'alias', False)),
+        table=None if unknown else getattr(sound, 'table', None))
+
+
+class Resolver(object):
+    """
+    Handles requests, using shared instances of systems, sound classes and data.
+    """
+    OPS = ('resolve', 'translate', 'soundclass', 'columns', 'batch')
+
+    def __init__(self, systems=('bipa',), soundclasses=SOUNDCLASS_SYSTEMS, data=()):
+        """
+        The given instances are preloaded, others are loaded upon first request.
+        """
+        registry.preload(TranscriptionSystem, systems)
+        registry.preload(SoundClasses, soundclasses)
+        registry.preload(TranscriptionData, data)
+
+    @staticmethod
+    def _flatten(requests):
+        for request in requests:
+            if isinstance(request, dict):
+                if request.get('op') == 'batch':
+                    yield from Resolver._flatten(request.get('requests') or [])
+                else:
+                    yield request
+
+    def handle_many(self, requests):
+        """
+        Handle a batch of requests.
+
+        :return: `list` of responses.
+        """
+        sounds = collections.defaultdict(dict)
+        for request in self._flatten(requests):
+            if request.get('op') == 'resolve' and isinstance(request.get('sounds'), list):
+                for sound in request['sounds']:
+                    if isinstance(sound, str):
+                        sounds[request.get('system', 'bipa')].setdefault(sound, None)
+        resolved = {}
+        for system, strings in sounds.items():
+            try:
+                ts = TranscriptionSystem(system)
+            except ValueError:
+                continue
+            resolved[system] = {
+                string: sound_as_dict(sound) for string, sound in
+                zip(strings, ts.resolve_many(strings, lazy=True)) if sound is not None}
+        return [self.handle(request, resolved) for request in requests]
+
+    def handle(self, request, resolved=None):
+        """
+        Handle a request.
+
+        :param resolved: `dict` of serialized sounds, by system and string.
+        :return: The response.
+        """
+        if not isinstance(request, dict):
+            return dict(error='invalid request')
+        response = {'id': request['id']} if 'id' in request else {}
+        op = request.get('op')
+        if op not in self.OPS:
+            response['error'] = 'unknown op: {0}'.format(op)
+            return response
+        try:
+            response['result'] = getattr(self, '_' + op)(request, resolved or {})
+        except Exception as e:
+            response['error'] = '{0}: {1}'.format(e.__class__.__name__, e)
+        return response
+
+    def _resolve(self, request, resolved):
+        system = request.get('system', 'bipa')
+        resolved = resolved.get(system, {})
+        ts = TranscriptionSystem(system)
+        return [
+            resolved[sound] if sound in resolved else sound_as_dict(ts[sound])
+            for sound in request['sounds']]
+
+    def _translate(self, request, resolved):
+        kind = request.get('kind', 'system')
+        if kind not in KINDS:
+            raise ValueError('unknown kind: {0}'.format(kind))
+        return TranscriptionSystem(request.get('system', 'bipa')).translate_many(
+            request['words'],
+            KINDS[kind](request['target']),
+            nearest=bool(request.get('nearest')))
+
+    def _soundclass(self, request, resolved):
+        return SoundClasses(request['model']).resolve_many(
+            request['sounds'], default=request.get('default', '0'))
+
+    def _columns(self, request, resolved):
+        ts = TranscriptionSystem(request.get('system', 'bipa'))
+        return [[type_, ts.columns[type_]] for type_ in ts.sound_classes]
+
+    def _batch(self, request, resolved):
+        return [self.handle(r, resolved) for r in request['requests']]
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        buffer = b''
+        while True:
+            data = self.request.recv(BUFFER_SIZE)
+            if not data:
+                break
+            lines = (buffer + data).split(b'\n')
+            buffer = lines.pop()
+            requests = []
+            for line in lines:
+                if line.strip():
+                    try:
+                        requests.append(json.loads(line.decode('utf8')))
+                    except ValueError:
+                        requests.append(None)
+            if requests:
+                self.request.sendall(b''.join(
+                    json.dumps(response, ensure_ascii=False).encode('utf8') + b'\n'
+                    for response in self.server.resolver.handle_many(requests)))
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def make_server(path=None, resolver=None):
+    """
+    Create a server listening at socket `path`, handling each connection in a thread.
+
+    A stale socket file - i.e. one without a daemon listening - is removed.
+    """
+    path = path or socket_path()
+    if os.path.exists(path):
+        client = connect(path)
+        if client:
+            client.close()
+            raise ValueError('a daemon is listening at {0} already'.format(path))
+        os.remove(path)
+    if not os.path.exists(os.path.dirname(os.path.abspath(path))):
+        os.makedirs(os.path.dirname(os.path.abspath(path)))
+    server = _Server(path, _Handler)
+    server.resolver = resolver or Resolver()
+    return server
+
+
+def serve(path=None, resolver=None):  # pragma: no cover
+    """
+    Run a daemon until it is interrupted.
+    """
+    server = make_server(path, resolver=resolver)
+    # Remove the socket file when being terminated, too:
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+class Client(object):
+    """
+    A connection to a daemon.
+    """
+    def __init__(self, path=None, timeout=None):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        try:
+            self.socket.connect(path or socket_path())
+        except OSError:
+            self.socket.close()
+            raise
+        self._file = self.socket.makefile('rb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._file.close()
+        self.socket.close()
+
+    def requests(self, requests):
+        """
+        Send requests at once and return the responses.
+        """
+        requests = list(requests)
+        self.socket.sendall(b''.join(
+            json.dumps(request, ensure_ascii=False).encode('utf8') + b'\n'
+            for request in requests))
+        res = []
+        for _ in requests:
+            line = self._file.readline()
+            if not line:
+                raise ConnectionError('connection closed by daemon')
+            res.append(json.loads(line.decode('utf8')))
+        return res
+
+    def request(self, op, **kw):
+        """
+        Send a request and return its result.
+
+        :raises ValueError: If the daemon returns an error.
+        """
+        kw['op'] = op
+        response = self.requests([kw])[0]
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response['result']
+
+
+def connect(path=None, timeout=None):
+    """
+    :return: `Client` connected to the daemon at `path` or `None`, if no daemon is running.
+    """
+    try:
+        return Client(path, timeout=timeout)
+    except OSError:
+        return None
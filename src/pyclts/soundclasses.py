@@ -1,5 +1,8 @@
-from pyclts.transcriptionsystem import Symbol, TranscriptionSystem
-from pyclts.util import read_data, TranscriptionBase
+from clldutils.misc import lazyproperty
+from csvw.dsv import UnicodeWriter, reader
+
+from pyclts.transcriptionsystem import Symbol, Sound, TranscriptionSystem
+from pyclts.util import read_data, pkg_path, TranscriptionBase
 
 SOUNDCLASS_SYSTEMS = ['sca', 'cv', 'art', 'dolgo', 'asjp', 'color']
 
@@ -21,6 +24,22 @@ class SoundClasses(TranscriptionBase):
                 self.classes.add(v[0]['grapheme'])
             self.system = TranscriptionSystem('bipa')
 
+    @lazyproperty
+    def _fallback(self):
+        """
+        Classes of sounds not listed in the data, by sound name (`None` for sounds without
+        class), starting with the precomputed classes from `fallback.tsv`.
+        """
+        res = {}
+        if fallback_path().exists():
+            rows = reader(fallback_path(), delimiter='\t', dicts=True)
+            for row in rows:
+                res[row['CLTS_NAME']] = row[self.id] or None
+        return res
+
+    def _preload(self):
+        self._fallback
+
     def resolve_sound(self, sound):
         """Function tries to identify a sound in the data.
 
@@ -28,12 +47,26 @@ class SoundClasses(TranscriptionBase):
         -----
         The function tries to resolve sounds to take a sound with less complex
         features in order to yield the next approximate sound class, if the
-        transcription data are sound classes.
+        transcription data are sound classes. Since this is deterministic, the results
+        are memoized by sound name.
         """
         sound = sound if isinstance(sound, Symbol) else self.system[sound]
         if sound.name in self.data:
             return self.data[sound.name]['grapheme']
         if not sound.type == 'unknownsound':
+            if sound.name not in self._fallback:
+                self._fallback[sound.name] = self._resolve_fallback(sound)
+            if self._fallback[sound.name] is not None:
+                return self._fallback[sound.name]
+        raise KeyError(":sc:resolve_sound: No sound could be found.")
+
+    def _resolve_fallback(self, sound):
+        """
+        Find the class of a sound which is not listed in the data.
+
+        :return: The class or `None`.
+        """
+        try:
             if sound.type in ['diphthong', 'cluster']:
                 return self.resolve_sound(sound.from_sound)
             name = [
@@ -41,8 +74,105 @@ class SoundClasses(TranscriptionBase):
                 self.system._feature_values.get(s, '') not in
                 ['laminality', 'ejection', 'tone']]
             while len(name) >= 4:
-                sound = self.system.get(' '.join(name))
-                if sound and sound.name in self.data:
-                    return self.resolve_sound(sound)
+                reduced = self.system.get(' '.join(name))
+                if reduced and reduced.name in self.data:
+                    return self.resolve_sound(reduced)
                 name.pop(0)
-        raise KeyError(":sc:resolve_sound: No sound could be found.")
+        except KeyError:
+            return None
+        if isinstance(sound, Sound):
+            # As last resort, we use the class of the most similar sound:
+            for match, _ in self.system.nearest(sound, k=1, same_manner=True):
+                if match.name in self.data:
+                    return self.data[match.name]['grapheme']
+        return None
+
+
+def fallback_path():
+    return pkg_path('soundclasses', 'fallback.tsv')
+
+
+def write_fallback(names):
+    """
+    Precompute the classes of all models for sounds which are not listed in the data.
+
+    :param names: Iterable of sound names; names of sounds listed in the data or which \
+    cannot be resolved are skipped.
+    :return: Number of sounds written to `fallback.tsv`.
+    """
+    models = [SoundClasses(model) for model in SOUNDCLASS_SYSTEMS]
+    for sc in models:
+        # Make sure we don't use the classes from an outdated table:
+        sc._fallback = {}
+    system = models[0].system
+    rows = []
+    for name in sorted(set(names)):
+        if name in models[0].data:
+            continue
+        try:
+            sound = system[name]
+        except ValueError:
+            continue
+        if sound.type == 'unknownsound':
+            continue
+        rows.append([sound.name] + [sc._resolve_fallback(sound) or '' for sc in models])
+
+    with UnicodeWriter(fallback_path(), delimiter='\t') as writer:
+        writer.writerow(['CLTS_NAME'] + SOUNDCLASS_SYSTEMS)
+        writer.writerows(rows)
+    for sc in models:
+        sc.__dict__.pop('_fallback', None)
+    return len(rows)
+
+
+def convert(corpus, models=None, default='0'):
+    """
+    Convert a segmented corpus into the sound classes of several models in one pass.
+
+    Each distinct sound is resolved only once, and sound classes are coded as integers,
+    e.g. for use in alignment code. Requires `numpy`.
+
+    :param corpus: Iterable of words, given as strings of whitespace separated sounds or \
+    sequences of sounds.
+    :param models: `list` of sound class models, see `SOUNDCLASS_SYSTEMS`; defaults to \
+    all models.
+    :param default: The class of sounds which cannot be converted, coded as `0`.
+    :return: pair (offsets, classes), where `classes` maps model IDs to pairs (codes, \
+    alphabet). The classes of word `i` are coded as `codes[offsets[i]:offsets[i + 1]]` \
+    and `alphabet[code]` is the class coded as `code`.
+    """
+    import numpy as np
+
+    models = [SoundClasses(model) for model in models or SOUNDCLASS_SYSTEMS]
+    system = TranscriptionSystem('bipa')
+    alphabets = [[default] + sorted(sc.classes - {default}) for sc in models]
+    indices = [{c: i for i, c in enumerate(alphabet)} for alphabet in alphabets]
+
+    def codes(sound):
+        sound = sound if isinstance(sound, Symbol) else system[sound]
+        res = []
+        for sc, index in zip(models, indices):
+            try:
+                res.append(index[sc.resolve_sound(sound)])
+            except KeyError:
+                res.append(0)
+        return res
+
+    resolved, rows, offsets = {}, [], [0]
+    for word in corpus:
+        for sound in (word.split() if isinstance(word, str) else word):
+            if isinstance(sound, Symbol):
+                rows.append(codes(sound))
+                continue
+            if sound not in resolved:
+                resolved[sound] = codes(sound)
+            rows.append(resolved[sound])
+        offsets.append(len(rows))
+
+    matrix = np.array(rows, dtype='uint16').reshape((len(rows), len(models)))
+    classes = {}
+    for i, (sc, alphabet) in enumerate(zip(models, alphabets)):
+        classes[sc.id] = (
+            matrix[:, i].astype('uint8' if len(alphabet) <= 2 ** 8 else 'uint16'),
+            alphabet)
+    return np.array(offsets, dtype='int64'), classes
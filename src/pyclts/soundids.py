@@ -0,0 +1,241 @@
+"""
+Stable integer IDs for sounds and compact encoding of segmented corpora.
+
+IDs are assigned per transcription system: 0 stands for unknown sounds, followed by the
+sounds defined in the system - sorted by name - and generated sounds in the order in
+which they are registered. Thus, an ID never changes as long as the list of registered
+names is kept, e.g. by saving it together with an encoded corpus.
+
+Corpora and sound inventories are encoded as `numpy` arrays; `numpy` can be installed via
+`pip install pyclts[numpy]`.
+"""
+import hashlib
+from pathlib import Path
+
+from clldutils import jsonlib
+
+from pyclts.transcriptionsystem import TranscriptionSystem
+from pyclts.models import Symbol, Sound
+
+__all__ = [
+    'UNKNOWN_ID', 'SoundIDs', 'save_corpus', 'load_corpus',
+    'overlap_matrix', 'jaccard_matrix', 'feature_distance_matrix']
+
+UNKNOWN_ID = 0
+
+
+class SoundIDs(object):
+    """
+    A registry of integer IDs for the sounds of a transcription system.
+
+    Sounds are identified by name, i.e. aliases and different source graphemes of a sound
+    share the same ID.
+    """
+    def __init__(self, ts, names=None):
+        """
+        :param ts: `TranscriptionSystem` instance or ID of a transcription system.
+        :param names: List of registered sound names, ordered by ID, e.g. as read from a \
+        file written with `save`. If `None`, only the sounds of `ts` are registered.
+        """
+        self.ts = ts if isinstance(ts, TranscriptionSystem) else TranscriptionSystem(ts)
+        if names is None:
+            names = [None] + sorted({sound.name for sound in self.ts.sounds.values()})
+        self.names = list(names)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        # IDs of the strings passed to `register`, to resolve each string only once.
+        self._items = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def version(self):
+        """Content hash identifying the ID space."""
+        sha = hashlib.sha256(self.ts.id.encode('utf8'))
+        for name in self.names:
+            sha.update(b'\0' + (name or '').encode('utf8'))
+        return sha.hexdigest()
+
+    def register(self, sound):
+        """
+        Return the ID of a sound, assigning a new ID if the sound isn't registered yet.
+
+        :param sound: `Symbol` instance or a string which can be resolved by the system.
+        """
+        if isinstance(sound, Symbol):
+            return self._register(sound)
+        if sound not in self._items:
+            self._items[sound] = self._register(self.ts[sound])
+        return self._items[sound]
+
+    def _register(self, sound):
+        name = sound.name
+        if name is None:
+            return UNKNOWN_ID
+        if name not in self.ids:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+        return self.ids[name]
+
+    def sound(self, id_):
+        """
+        :return: The sound with ID `id_` or `None` for `UNKNOWN_ID`.
+        """
+        name = self.names[id_]
+        return None if name is None else self.ts[name]
+
+    @property
+    def dtype(self):
+        """The smallest unsigned integer type which can hold all IDs."""
+        return 'uint16' if len(self.names) <= 2 ** 16 else 'uint32'
+
+    def encode(self, corpus):
+        """
+        Encode a segmented corpus as flat arrays of sound IDs.
+
+        :param corpus: Iterable of words, given as strings of whitespace separated sounds \
+        or sequences of sounds.
+        :return: pair (ids, offsets) of `numpy` arrays, where the IDs for word `i` are \
+        `ids[offsets[i]:offsets[i + 1]]`.
+        """
+        import numpy as np
+
+        ids, offsets = [], [0]
+        for word in corpus:
+            ids.extend(
+                self.register(s) for s in (word.split() if isinstance(word, str) else word))
+            offsets.append(len(ids))
+        return np.array(ids, dtype=self.dtype), np.array(offsets, dtype='int64')
+
+    def decode(self, ids, offsets=None):
+        """
+        Decode arrays of sound IDs.
+
+        :return: `list` of sounds or - if `offsets` are given - `list` of words, i.e. lists \
+        of sounds. Unknown sounds are decoded as `None`.
+        """
+        sounds = {i: self.sound(i) for i in set(int(i) for i in ids)}
+        if offsets is None:
+            return [sounds[int(i)] for i in ids]
+        return [
+            [sounds[int(i)] for i in ids[offsets[j]:offsets[j + 1]]]
+            for j in range(len(offsets) - 1)]
+
+    def encode_inventories(self, inventories):
+        """
+        Encode sound inventories as bitsets over the sound IDs.
+
+        Since registering sounds extends the ID space, only inventories encoded in the same
+        call can be compared.
+
+        :param inventories: Iterable of inventories, i.e. iterables of sounds.
+        :return: Boolean `numpy` array with one row per inventory and one column per ID, \
+        i.e. `inventories[i]` contains the sound with ID `j` if `matrix[i, j]` is `True`. \
+        Unknown sounds are ignored.
+        """
+        import numpy as np
+
+        ids = [{self.register(sound) for sound in inventory} for inventory in inventories]
+        matrix = np.zeros((len(ids), len(self.names)), dtype=bool)
+        for i, row in enumerate(ids):
+            matrix[i, sorted(row - {UNKNOWN_ID})] = True
+        return matrix
+
+    def save(self, path):
+        jsonlib.dump(
+            dict(system=self.ts.id, version=self.version, names=self.names),
+            path,
+            ensure_ascii=False,
+            indent=0)
+
+    @classmethod
+    def load(cls, path):
+        data = jsonlib.load(path)
+        res = cls(data['system'], names=data['names'])
+        if res.version != data['version']:
+            raise ValueError('inconsistent sound IDs in {0}'.format(path))
+        return res
+
+
+def save_corpus(directory, sound_ids, ids, offsets):
+    """
+    Save an encoded corpus as `.npy` files, together with its sound IDs.
+    """
+    import numpy as np
+
+    directory = Path(directory)
+    if not directory.exists():
+        directory.mkdir(parents=True)
+    sound_ids.save(directory / 'sounds.json')
+    np.save(str(directory / 'ids.npy'), ids)
+    np.save(str(directory / 'offsets.npy'), offsets)
+
+
+def load_corpus(directory, mmap_mode='r'):
+    """
+    Load a corpus written with `save_corpus`.
+
+    :param mmap_mode: Passed to `numpy.load`, i.e. by default the arrays are memory-mapped.
+    :return: triple (`SoundIDs`, ids, offsets).
+    """
+    import numpy as np
+
+    directory = Path(directory)
+    return (
+        SoundIDs.load(directory / 'sounds.json'),
+        np.load(str(directory / 'ids.npy'), mmap_mode=mmap_mode),
+        np.load(str(directory / 'offsets.npy'), mmap_mode=mmap_mode))
+
+
+def overlap_matrix(matrix):
+    """
+    :param matrix: Inventories as returned by `SoundIDs.encode_inventories`.
+    :return: Square matrix of the number of sounds shared by two inventories; the diagonal \
+    holds the inventory sizes.
+    """
+    matrix = matrix.astype('float32')
+    # The counts are integers below 2 ** 24, thus exact in float32:
+    return (matrix @ matrix.T).astype('int64')
+
+
+def jaccard_matrix(matrix):
+    """
+    :return: Square matrix of the Jaccard similarities of inventories, with `0` for pairs \
+    of empty inventories.
+    """
+    import numpy as np
+
+    overlap = overlap_matrix(matrix)
+    sizes = overlap.diagonal()
+    union = sizes[:, None] + sizes[None, :] - overlap
+    return np.divide(
+        overlap, union, out=np.zeros(overlap.shape, dtype='float64'), where=union > 0)
+
+
+def feature_distance_matrix(sound_ids, matrix):
+    """
+    Compute distances between inventories weighted by the features of their sounds.
+
+    Each inventory is described by the relative frequencies of the feature values of its
+    sounds (see `TranscriptionSystem.feature_matrix`), and the distance of two inventories
+    is the total variation distance of these distributions, i.e. a value between `0` for
+    inventories with the same feature profile and `1` for inventories without shared
+    features. Thus, inventories with similar - but not identical - sounds are close.
+
+    :param sound_ids: The `SoundIDs` used to encode the inventories.
+    :param matrix: Inventories as returned by `SoundIDs.encode_inventories`.
+    """
+    import numpy as np
+
+    ids, sounds = [], []
+    for i in range(matrix.shape[1]):
+        sound = sound_ids.sound(i)
+        if isinstance(sound, Sound):
+            ids.append(i)
+            sounds.append(sound)
+    features = np.zeros((matrix.shape[1], len(sound_ids.ts.feature_columns)), dtype='float32')
+    features[ids] = sound_ids.ts.feature_matrix(sounds)
+    profiles = matrix.astype('float32') @ features
+    totals = profiles.sum(axis=1, keepdims=True)
+    profiles = np.divide(profiles, totals, out=np.zeros_like(profiles), where=totals > 0)
+    return 0.5 * np.abs(profiles[:, None, :] - profiles[None, :, :]).sum(axis=2)
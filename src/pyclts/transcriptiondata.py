@@ -1,31 +1,120 @@
-from pyclts.util import read_data, TranscriptionBase
+import functools
+
+from clldutils.misc import lazyproperty
+from csvw.dsv import reader
+
+from pyclts.util import read_data, pkg_path, TranscriptionBase
 from pyclts.transcriptionsystem import Sound, TranscriptionSystem
+from pyclts import cache
+
+# The columns of a transcription data file, which can be read in addition to GRAPHEME:
+COLUMNS = [
+    'URL',
+    'BIPA_GRAPHEME',
+    'GENERATED',
+    'LATEX',
+    'FEATURES',
+    'SOUND',
+    'IMAGE',
+    'COUNT',
+    'NOTE',
+    'EXPLICIT',
+]
+
+
+@functools.lru_cache(maxsize=1)
+def grapheme_index():
+    """
+    Index of the graphemes of all transcription datasets.
+
+    The index is built from the data files once and then read from the cache directory,
+    see `pyclts.cache.load_grapheme_index`. If the cache directory can't be written, the
+    index is built anew in each process.
+
+    :return: `dict` mapping graphemes to `dict`s mapping dataset IDs to BIPA graphemes.
+    """
+    index = cache.load_grapheme_index()
+    if index is None:
+        index = {}
+        for path in sorted(pkg_path('transcriptiondata').glob('*.tsv'), key=lambda p: p.name):
+            rows = reader(path, delimiter='\t')
+            header = next(rows)
+            gindex, bindex = header.index('GRAPHEME'), header.index('BIPA_GRAPHEME')
+            for row in rows:
+                index.setdefault(row[gindex], {})[path.stem] = row[bindex]
+        try:
+            cache.write_grapheme_index(index)
+        except OSError:
+            # The cache is an optimization, so we don't fail if it can't be written.
+            pass
+    return index
 
 
 class TranscriptionData(TranscriptionBase):
     """
     Class for handling transcription data.
+
+    The data file is only read when the data is first accessed. To speed up reading, the
+    columns copied into the per-grapheme dicts can be restricted, e.g.
+    `TranscriptionData('phoible', columns=['GRAPHEME'])`.
     """
-    def __init__(self, id_):
-        if not hasattr(self, 'data'):
+    def __init__(self, id_, columns=None):
+        columns = set(COLUMNS if columns is None else columns) - {'GRAPHEME'}
+        if columns - set(COLUMNS):
+            raise ValueError('unknown columns: {0}'.format(columns - set(COLUMNS)))
+        if not hasattr(self, 'columns'):
             # Only initialize, if this is really a new instance!
-            self.data, self.sounds, self.names = read_data(
-                'transcriptiondata',
-                id_ + '.tsv',
-                'GRAPHEME',
-                'URL',
-                'BIPA_GRAPHEME',
-                'GENERATED',
-                'URL',
-                'LATEX',
-                'FEATURES',
-                'SOUND',
-                'IMAGE',
-                'COUNT',
-                'NOTE',
-                'EXPLICIT'
-            )
-            self.system = TranscriptionSystem('bipa')
+            if not pkg_path('transcriptiondata', id_ + '.tsv').exists():
+                raise ValueError('unknown transcription data: {0}'.format(id_))
+            self.columns = columns
+        elif not columns.issubset(self.columns):
+            # Since instances are shared, we must make sure all requested columns are
+            # available, thus we have to re-read the data.
+            self.columns = self.columns | columns
+            self.__dict__.pop('_table', None)
+            self.__dict__.pop('_graphemes', None)
+
+    @lazyproperty
+    def _table(self):
+        return read_data(
+            'transcriptiondata', self.id + '.tsv', 'GRAPHEME', *sorted(self.columns))
+
+    @property
+    def data(self):
+        return self._table[0]
+
+    @property
+    def sounds(self):
+        return self._table[1]
+
+    @property
+    def names(self):
+        return self._table[2]
+
+    @lazyproperty
+    def _graphemes(self):
+        return {k: '//'.join(item['grapheme'] for item in v) for k, v in self.data.items()}
+
+    @lazyproperty
+    def system(self):
+        return TranscriptionSystem('bipa')
+
+    def _preload(self):
+        self._graphemes
+        self.system
+
+    def prewarm(self, limit=None):
+        """
+        Fill the cache of the BIPA system with the graphemes of the data.
+
+        :param limit: Only resolve the `limit` most frequent graphemes, according to the \
+        COUNT column.
+        """
+        counts = {}
+        for items in TranscriptionData(self.id, columns=['COUNT']).data.values():
+            for item in items:
+                counts[item['grapheme']] = int(item['count'] or 0)
+        self.system.prewarm(sorted(counts, key=lambda g: (-counts[g], g))[:limit])
 
     def resolve_sound(self, sound):
         """Function tries to identify a sound in the data.
@@ -37,6 +126,18 @@ class TranscriptionData(TranscriptionBase):
         transcription data are sound classes.
         """
         sound = sound if isinstance(sound, Sound) else self.system[sound]
-        if sound.name in self.data:
-            return '//'.join([x['grapheme'] for x in self.data[sound.name]])
+        if sound.name in self._graphemes:
+            return self._graphemes[sound.name]
         raise KeyError(":td:resolve_sound: No sound could be found.")
+
+    def to_bipa(self, grapheme):
+        """
+        Convert a grapheme of the dataset into BIPA.
+
+        :return: The BIPA grapheme.
+        :raises KeyError: If the grapheme is not in the dataset or has no valid BIPA sound.
+        """
+        res = grapheme_index().get(grapheme, {}).get(self.id)
+        if res is None or res == '<NA>':
+            raise KeyError(":td:to_bipa: No sound could be found.")
+        return res
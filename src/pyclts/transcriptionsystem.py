@@ -3,25 +3,65 @@ Transcription System module for consistent IPA handling.
 ========================================
 
 """
-import re
+import sys
+import heapq
+import weakref
+import threading
+import unicodedata
+import functools
 
 from csvw import TableGroup
 from clldutils import jsonlib
 import attr
 
-from pyclts.util import pkg_path, nfd, norm, EMPTY, itertable, TranscriptionBase
+from pyclts.util import (
+    pkg_path, nfd, norm, EMPTY, itertable, popcount, TranscriptionBase, Trie)
 from pyclts.models import *  # noqa: F403
+from pyclts import cache
+
+# Default number of resolved sounds kept in the cache of a transcription system:
+CACHE_SIZE = 2 ** 16
+# Types of sounds, i.e. of the values which are added to the features of a sound:
+SOUND_TYPES = ['cluster', 'consonant', 'diphthong', 'tone', 'vowel']
+
+
+def _intern(item):
+    """
+    Intern the string values of a data row, so that sounds share their feature values.
+    """
+    return {k: sys.intern(v) if isinstance(v, str) else v for k, v in item.items()}
 
 
 class TranscriptionSystem(TranscriptionBase):
     """
-    A transcription System."""
-    def __init__(self, id_):
+    A transcription System.
+
+    Sounds returned by a transcription system are immutable, thus results of
+    `resolve_sound` - including unknown sounds - are cached in a LRU cache. In addition,
+    parsed sounds can be stored in a persistent cache, see `set_parse_cache`. Sounds with
+    identical attributes are shared, i.e. there's only one instance per sound in memory.
+
+    Generated sounds which appear in the transcription data are looked up in a table
+    shipped with the package before they are parsed, see `pyclts.cache.write_generated`.
+
+    Instances can be shared by threads; to compile all data up front, load them with
+    `pyclts.util.registry.preload`.
+    """
+    _parse_cache = None
+    _generated = None
+    _nearest = None
+    _outputs = ('sound', 'grapheme', 'name')
+
+    def __init__(self, id_, cache_size=None):
         """
         :param system: The name of a transcription system or a directory containing one.
+        :param cache_size: Maximal number of sounds kept in the cache; `None` means \
+        `CACHE_SIZE` for new instances and "unchanged" for existing ones.
         """
         if hasattr(self, 'features'):
             # Only initialize, if this is really a new instance!
+            if cache_size is not None and cache_size != self.cache_size:
+                self.clear_cache(cache_size)
             return
         assert id_
         system = pkg_path('transcriptionsystems', id_)
@@ -31,6 +71,11 @@ class TranscriptionSystem(TranscriptionBase):
         self.system = TableGroup.from_file(
             pkg_path('transcriptionsystems', 'transcription-system-metadata.json'))
         self.system._fname = system / 'metadata.json'
+        self.clear_cache(CACHE_SIZE if cache_size is None else cache_size)
+
+        # If a snapshot matching the current data has been cached, we are done.
+        if cache.load_snapshot(self, id_):
+            return
 
         self.features = {'consonant': {}, 'vowel': {}, 'tone': {}}
         # dictionary for feature values, checks when writing elements from
@@ -43,11 +88,21 @@ class TranscriptionSystem(TranscriptionBase):
         self.diacritics = dict(
             consonant={}, vowel={}, click={}, diphthong={}, tone={}, cluster={})
         for dia in itertable(self.system.tabledict['diacritics.tsv']):
+            dia = _intern(dia)
             if not dia['alias'] and not dia['typography']:
                 self.features[dia['type']][dia['value']] = dia['grapheme']
             # assign feature values to the dictionary
             self._feature_values[dia['value']] = dia['feature']
             self.diacritics[dia['type']][dia['grapheme']] = dia['value']
+        # characters which can be attached to a base sound when segmenting a string
+        self._pre_diacritics, self._post_diacritics = set(), set()
+        for graphemes in self.diacritics.values():
+            for grapheme in graphemes:
+                if grapheme and len(grapheme) == 2:
+                    if grapheme[1] == EMPTY:
+                        self._pre_diacritics.add(grapheme[0])
+                    elif grapheme[0] == EMPTY:
+                        self._post_diacritics.add(grapheme[1])
 
         self.sound_classes = {}
         self.columns = {}  # the basic column structure, to allow for rendering
@@ -67,10 +122,11 @@ class TranscriptionSystem(TranscriptionBase):
                     .asdict()['tableSchema']['columns']]
             for l, item in enumerate(itertable(
                     self.system.tabledict['{0}s.tsv'.format(type_)])):
+                item = _intern(item)
                 if item['grapheme'] in self.sounds:
                     raise ValueError('duplicate grapheme in {0}:{1}: {2}'.format(
                         type_ + 's.tsv', l + 2, item['grapheme']))
-                sound = cls(ts=self, **item)
+                sound = cls(ts=self, source=item['grapheme'], normalized=False, **item)
                 # make sure this does not take too long
                 for key, value in item.items():
                     if key not in {'grapheme', 'note', 'alias'} and \
@@ -99,18 +155,39 @@ class TranscriptionSystem(TranscriptionBase):
             raise ValueError(
                 'Orphaned aliases in line(s) {0}'.format(error))
 
-        # basic regular expression, used to match the basic sounds in the system.
-        self._regex = None
-        self._update_regex()
+        # inverted index: graphemes of sounds by (type, feature, value), see query
+        self._postings, self._types = {}, {}
+        for grapheme, sound in self.sounds.items():
+            if isinstance(sound, Sound):  # noqa: F405
+                self._types.setdefault(sound.type, set()).add(grapheme)
+                for feature in sound._name_order:
+                    self._postings.setdefault(
+                        (sound.type, feature, getattr(sound, feature)), set()).add(grapheme)
+
+        # prefix tree, used to match the basic sounds in the system.
+        self._trie = Trie(self.sounds)
+        # features and canonical graphemes of diacritic sequences, see _compile_diacritics
+        self._diacritic_sequences = {}
+        # sounds resolved from names, keyed by the set of name components
+        self._names = {}
+        # base graphemes of generated sounds, see _base_grapheme
+        self._base_graphemes = {}
 
         # normalization data
         self._normalize = {
             norm(r['source']): norm(r['target'])
             for r in itertable(self.system.tabledict['normalize.tsv'])}
-
-    def _update_regex(self):
-        self._regex = re.compile('|'.join(
-            map(re.escape, sorted(self.sounds, key=lambda x: len(x), reverse=True))))
+        # Normalization replaces single characters of the NFD normalized string, thus we
+        # can use str.translate.
+        self._normalize_table = str.maketrans(
+            {k: v for k, v in self._normalize.items() if len(k) == 1})
+
+        # Columns of the feature matrix: the feature values listed in features.json,
+        # followed by additional values used in the system and the sound types.
+        values = {v for type_ in features.values() for vs in type_.values() for v in vs}
+        self.feature_columns = sorted(values) + sorted(
+            set(self._feature_values) - values) + SOUND_TYPES
+        self._feature_index = {v: i for i, v in enumerate(self.feature_columns)}
 
     def _norm(self, string):
         """Extended normalization: normalize by list of norm-characers, split
@@ -123,7 +200,7 @@ class TranscriptionSystem(TranscriptionBase):
 
     def normalize(self, string):
         """Normalize the string according to normalization list"""
-        return ''.join([self._normalize.get(x, x) for x in nfd(string)])
+        return nfd(string).translate(self._normalize_table)
 
     def _from_name(self, string):
         """Parse a sound from its name"""
@@ -160,17 +237,44 @@ class TranscriptionSystem(TranscriptionBase):
 
         if sound_class not in self.sound_classes:
             raise ValueError('no sound class specified')
+        # The order of the features doesn't matter, but the sound class must come last:
+        key = (sound_class, frozenset(rest))
+        if key in self._names:
+            return self._names[key]
 
         args = {self._feature_values.get(comp, '?'): comp for comp in rest}
         if '?' in args:
             raise ValueError('string contains unknown features')
+        # If a feature is specified more than once, the result depends on the order of
+        # components, thus we can only memoize the result for unambiguous names.
+        memoize = len(args) == len(rest)
         args['grapheme'] = ''
         args['ts'] = self
         sound = self.sound_classes[sound_class](**args)
-        if sound.featureset not in self.features:
-            sound.generated = True
-            return sound
-        return self.features[sound.featureset]
+        if sound.featureset in self.features:
+            sound = self.features[sound.featureset]
+        else:
+            sound = attr.evolve(sound, generated=True)
+        if memoize:
+            self._names[key] = sound
+        return sound
+
+    def from_names(self, names, default=None):
+        """
+        Resolve sounds from a sequence of names.
+
+        :param default: Value returned for names which cannot be resolved.
+        :return: `list` of sounds.
+        """
+        resolved, res = {}, []
+        for name in names:
+            if name not in resolved:
+                try:
+                    resolved[name] = self._from_name(name)
+                except ValueError:
+                    resolved[name] = default
+            res.append(resolved[name])
+        return res
 
     def _parse(self, string):
         """Parse a string and return its features.
@@ -189,16 +293,17 @@ class TranscriptionSystem(TranscriptionBase):
         # check whether sound is in self.sounds
         if nstring in self.sounds:
             sound = self.sounds[nstring]
-            sound.normalized = nstring != string
-            sound.source = string
+            if sound.source != string:
+                # sounds are shared, so we return a copy rather than modifying them
+                return attr.evolve(sound, normalized=nstring != string, source=string)
             return sound
 
-        match = list(self._regex.finditer(nstring))
+        match = list(self._trie.finditer(nstring))
         # if the match has length 2, we assume that we have two sounds, so we split
         # the sound and pass it on for separate evaluation (recursive function)
         if len(match) == 2:
-            sound1 = self._parse(nstring[:match[1].start()])
-            sound2 = self._parse(nstring[match[1].start():])
+            sound1 = self._parse(nstring[:match[1][0]])
+            sound2 = self._parse(nstring[match[1][0]:])
             # if we have ANY unknown sound, we mark the whole sound as unknown, if
             # we have two known sounds of the same type (vowel or consonant), we
             # either construct a diphthong or a cluster
@@ -219,68 +324,385 @@ class TranscriptionSystem(TranscriptionBase):
             # Either no match or more than one; both is considered an error.
             return UnknownSound(grapheme=nstring, source=string, ts=self)  # noqa: F405
 
-        pre, mid, post = nstring.partition(nstring[match[0].start():match[0].end()])
+        pre, mid, post = nstring.partition(nstring[match[0][0]:match[0][1]])
         base_sound = self.sounds[mid]
         if isinstance(base_sound, Marker):  # noqa: F405
             assert pre or post
             return UnknownSound(grapheme=nstring, source=string, ts=self)  # noqa: F405
 
         # A base sound with diacritics or a custom symbol.
-        features = attr.asdict(base_sound)
-        features.update(
-            source=string,
-            generated=True,
-            normalized=nstring != string,
-            base=base_sound.grapheme)
+        diacritics = self._compile_diacritics(base_sound.type, pre, post)
+        if diacritics is None:
+            # we are strict: if we don't know a feature, it's an unknown sound
+            return UnknownSound(grapheme=nstring, source=string, ts=self)  # noqa: F405
+        features, sound_pre, sound_post = diacritics
 
         # we construct two versions: the "normal" version and the version where
         # we search for aliases and normalize them (as our features system for
         # diacritics may well define aliases
-        grapheme, sound = '', ''
-        for dia in [p + EMPTY for p in pre]:
-            feature = self.diacritics[base_sound.type].get(dia, {})
-            if not feature:
-                return UnknownSound(  # noqa: F405
-                    grapheme=nstring, source=string, ts=self)
-            features[self._feature_values[feature]] = feature
-            # we add the unaliased version to the grapheme
-            grapheme += dia[0]
-            # we add the corrected version (if this is needed) to the sound
-            sound += self.features[base_sound.type][feature][0]
-        # add the base sound
-        grapheme += base_sound.grapheme
-        sound += base_sound.s
-        for dia in [EMPTY + p for p in post]:
-            feature = self.diacritics[base_sound.type].get(dia, {})
-            # we are strict: if we don't know the feature, it's an unknown
-            # sound
-            if not feature:
-                return UnknownSound(  # noqa: F405
-                    grapheme=nstring, source=string, ts=self)
-            features[self._feature_values[feature]] = feature
-            grapheme += dia[1]
-            sound += self.features[base_sound.type][feature][1]
-
-        features['grapheme'] = sound
-        new_sound = self.sound_classes[base_sound.type](**features)
+        grapheme = pre + base_sound.grapheme + post
+        sound = sound_pre + base_sound.s + sound_post
+        new_sound = attr.evolve(
+            base_sound,
+            source=string,
+            generated=True,
+            normalized=nstring != string,
+            base=base_sound.grapheme,
+            grapheme=sound,
+            **features)
         # check whether grapheme differs from re-generated sound
-        if str(new_sound) != sound:
-            new_sound.alias = True
-        if grapheme != sound:
-            new_sound.alias = True
-            new_sound.grapheme = grapheme
+        if str(new_sound) != sound or grapheme != sound:
+            new_sound = attr.evolve(new_sound, alias=True, grapheme=grapheme)
         return new_sound
 
+    def _load_generated(self):
+        if self._generated is None:
+            with self._lock:
+                if self._generated is None:
+                    self._generated = cache.load_generated(self.id)
+        return self._generated
+
+    def _generated_sound(self, string):
+        """
+        Restore a generated sound from the table of precomputed sounds.
+
+        :param string: An NFD normalized string.
+        :return: `Sound` instance or `None` if the string is not in the table.
+        """
+        row = self._load_generated().get(string)
+        if row is None:
+            return None
+        base, grapheme, features, alias, normalized = row
+        base_sound = self.sounds.get(base)
+        if base_sound is None:  # pragma: no cover
+            return None
+        return attr.evolve(
+            base_sound,
+            source=string,
+            generated=True,
+            normalized=bool(normalized),
+            base=base,
+            grapheme=grapheme,
+            alias=True if alias else base_sound.alias,
+            **{self._feature_values[f]: f for f in features.split()})
+
+    def _compile_diacritics(self, type_, pre, post):
+        """
+        Translate the diacritics preceding and following a base sound into features.
+
+        :return: `None`, if any of the diacritics is unknown, otherwise a triple \
+        (features, canonical pre-diacritics, canonical post-diacritics).
+
+        Notes
+        -----
+        Since the number of distinct diacritic sequences in actual data is small, we
+        store the result for each sequence, thus sounds with the same diacritics are
+        compiled in a single dictionary lookup.
+        """
+        key = (type_, pre, post)
+        if key not in self._diacritic_sequences:
+            diacritics, canonical = self.diacritics[type_], self.features[type_]
+            features, sound_pre, sound_post = {}, '', ''
+            for char in pre:
+                feature = diacritics.get(char + EMPTY)
+                if not feature:
+                    return None
+                features[self._feature_values[feature]] = feature
+                # we add the corrected version (if this is needed) to the sound
+                sound_pre += canonical[feature][0]
+            for char in post:
+                feature = diacritics.get(EMPTY + char)
+                if not feature:
+                    return None
+                features[self._feature_values[feature]] = feature
+                sound_post += canonical[feature][1]
+            self._diacritic_sequences[key] = (features, sound_pre, sound_post)
+        return self._diacritic_sequences[key]
+
+    def _base_grapheme(self, elements, default):
+        """
+        Determine the base grapheme and the features it expresses for rendering a sound.
+
+        :param elements: `tuple` of the features of a sound (without features which are \
+        never expressed by the base) followed by its type.
+        :param default: Fallback grapheme, if no base sound can be found.
+        :return: pair (base grapheme, set of feature names expressed by the base).
+
+        Notes
+        -----
+        The base is the sound matching the shortest tail of `elements`. Since the number of
+        distinct feature bundles is small compared to the number of sounds, the lookups are
+        stored in an index.
+        """
+        if elements not in self._base_graphemes:
+            base = None
+            for i in range(len(elements)):
+                sound = self.features.get(frozenset(elements[i:]))
+                if sound:
+                    base = sound.grapheme
+            self._base_graphemes[elements] = base
+        base = self._base_graphemes[elements] or default or '<?>'
+        if base == '<?>':
+            return base, set()
+        return base, {
+            self._feature_values[elm] for elm in self.sounds[base].name.split(' ')[:-1]}
+
     def resolve_sound(self, string):
         if isinstance(string, Sound):  # noqa: F405
             return self.features[string.featureset]
         elif isinstance(string, Symbol):  # noqa: F405
             return string
+        return self._cache(string)
+
+    def _resolve_string(self, string):
         if set(string.split(' ')).intersection(
                 list(self.sound_classes) + ['diphthong', 'cluster']):
             return self._from_name(string)
         string = nfd(string)
-        return self._parse(string)
+        if string in self.sounds:
+            return self._parse(string)
+        sound = self._generated_sound(string)
+        if sound is None and self._parse_cache:
+            sound = self._parse_cache.get(self, string)
+        if sound is None:
+            sound = self._parse(string)
+            if self._parse_cache:
+                self._parse_cache.add(self, string, sound)
+        # Sounds are immutable, so we can return an existing instance with the same
+        # attributes, if there is one:
+        key = (type(sound),) + tuple(
+            getattr(sound, a.name) for a in attr.fields(type(sound))
+            if a.init and a.name != 'ts')
+        with self._lock:
+            return self._sounds.setdefault(key, sound)
+
+    def _preload(self):
+        self._load_generated()
+        self._nearest_index
+
+    def clear_cache(self, cache_size=None):
+        """
+        Clear the cache of resolved sounds.
+
+        :param cache_size: New maximal size of the cache.
+        """
+        if cache_size is not None:
+            self.cache_size = cache_size
+        if '_lock' not in self.__dict__:
+            # Instances not created via the registry, e.g. restored from a snapshot:
+            self._lock = threading.RLock()
+        self._cache = functools.lru_cache(maxsize=self.cache_size)(self._resolve_string)
+        # Resolved sounds by attributes. Since sounds are only kept as long as they are
+        # used, this doesn't grow without bounds like a cache.
+        self._sounds = weakref.WeakValueDictionary()
+
+    def set_parse_cache(self, parse_cache):
+        """
+        Use a persistent cache for parsed sounds, which can be shared across processes.
+
+        :param parse_cache: `pyclts.cache.ParseCache` instance or `None`.
+        """
+        self._parse_cache = parse_cache
+        self.clear_cache()
+
+    def cache_info(self):
+        return self._cache.cache_info()
+
+    def prewarm(self, graphemes):
+        """
+        Fill the cache by resolving the given graphemes.
+        """
+        for grapheme in graphemes:
+            try:
+                self.resolve_sound(grapheme)
+            except ValueError:
+                pass
+
+    def segment(self, string):
+        """
+        Split an unsegmented string into sounds.
+
+        :param string: A string of sounds, optionally separated by whitespace.
+        :return: `list` of `Symbol` instances.
+
+        Notes
+        -----
+        Base sounds are matched greedily, i.e. the longest grapheme known to the system
+        is matched first. Diacritics are attached to the preceding base sound, unless
+        they can only be written before a sound (like pre-aspiration) or there is no
+        preceding sound.
+        """
+        segments = []
+        for chunk in self.normalize(norm(string)).split():
+            chunk_segments, pre, i = [], '', 0
+            while i < len(chunk):
+                length = self._trie.longest(chunk, i)
+                if length:
+                    chunk_segments.append(pre + chunk[i:i + length])
+                    pre = ''
+                    i += length
+                    continue
+                char = chunk[i]
+                if chunk_segments and not pre and (
+                        char in self._post_diacritics or unicodedata.combining(char)):
+                    chunk_segments[-1] += char
+                elif char in self._pre_diacritics:
+                    pre += char
+                else:
+                    chunk_segments.append(pre + char)
+                    pre = ''
+                i += 1
+            if pre:
+                chunk_segments.append(pre)
+            segments.extend(chunk_segments)
+        return [self[segment] for segment in segments]
+
+    def feature_matrix(self, sounds=None):
+        """
+        One-hot encoding of the feature sets of sounds.
+
+        :param sounds: Iterable of sounds or strings which can be resolved to sounds; \
+        defaults to the sounds defined in the system - without aliases and markers - \
+        sorted by grapheme.
+        :return: `numpy` array of dtype `uint8` with one row per sound and one column per \
+        item of `feature_columns`.
+        """
+        import numpy as np
+
+        if sounds is None:
+            sounds = [
+                sound for _, sound in sorted(self.sounds.items())
+                if isinstance(sound, Sound) and not sound.alias]  # noqa: F405
+        rows, columns, nrows = [], [], 0
+        for i, sound in enumerate(sounds):
+            if not isinstance(sound, Symbol):  # noqa: F405
+                sound = self[sound]
+            if not isinstance(sound, Sound):  # noqa: F405
+                raise ValueError('no features for {0}'.format(sound))
+            for value in sound.featureset:
+                rows.append(i)
+                columns.append(self._feature_index[value])
+            nrows = i + 1
+        matrix = np.zeros((nrows, len(self.feature_columns)), dtype='uint8')
+        matrix[rows, columns] = 1
+        return matrix
+
+    def similarity_matrix(self, sounds_a, sounds_b=None):
+        """
+        Compute the pairwise similarities of two lists of sounds, see `Sound.similarity`.
+
+        :param sounds_b: Defaults to `sounds_a`.
+        :return: `numpy` array of shape (len(sounds_a), len(sounds_b)).
+        """
+        a = self.feature_matrix(sounds_a).astype('float32')
+        b = a if sounds_b is None else self.feature_matrix(sounds_b).astype('float32')
+        # The counts are small integers, thus exact in float32:
+        intersection = (a @ b.T).astype('float64')
+        union = a.sum(axis=1)[:, None] + b.sum(axis=1)[None, :] - intersection
+        return intersection / union
+
+    def feature_values(self):
+        """
+        :return: Sorted `list` of the triples (type, feature, value) used by the sounds of \
+        the system, with value `''` for features without value.
+        """
+        return sorted((t, f, v or '') for t, f, v in self._postings)
+
+    def query(self, type=None, aliases=False, exclude=None, **features):
+        """
+        Find the sounds defined in the system which match a feature specification.
+
+        Sounds must match all features passed as keyword arguments, e.g.
+        `ts.query(type='consonant', manner='implosive', phonation='voiced')`. A value can
+        be a string, `None` - matching sounds without value for the feature - or a
+        collection of these, matching any of them.
+
+        :param type: Sound type or collection of sound types to restrict the query to.
+        :param aliases: Whether to include aliased sounds.
+        :param exclude: `dict` mapping features to values, which sounds must *not* match.
+        :return: `list` of sounds, sorted by grapheme.
+        """
+        exclude = exclude or {}
+        known = {f for _, f, _ in self._postings}
+        unknown = (set(features) | set(exclude)) - known
+        if unknown:
+            raise ValueError('unknown features: {0}'.format(sorted(unknown)))
+
+        def matching(type_, feature, value):
+            values = value if isinstance(value, (list, tuple, set, frozenset)) else [value]
+            res = set()
+            for v in values:
+                res |= self._postings.get((type_, feature, v), set())
+            return res
+
+        if type is None:
+            types = set(self._types)
+        else:
+            types = {type} if isinstance(type, str) else set(type)
+        res = set()
+        for type_ in types:
+            selected = set(self._types.get(type_, set()))
+            for feature, value in features.items():
+                selected &= matching(type_, feature, value)
+            for feature, value in exclude.items():
+                selected -= matching(type_, feature, value)
+            res |= selected
+        return [
+            self.sounds[g] for g in sorted(res) if aliases or not self.sounds[g].alias]
+
+    def _bitmask(self, featureset):
+        mask = 0
+        for value in featureset:
+            if value in self._feature_index:
+                mask |= 1 << self._feature_index[value]
+        return mask
+
+    @property
+    def _nearest_index(self):
+        """
+        Bitmasks of the feature sets of the sounds defined in the system (without
+        aliases), by sound type. Bit i of a bitmask is set if the feature set contains
+        `feature_columns[i]`.
+        """
+        if self._nearest is None:
+            with self._lock:
+                if self._nearest is None:
+                    index = {}
+                    for _, sound in sorted(self.sounds.items()):
+                        if isinstance(sound, Sound) and not sound.alias:  # noqa: F405
+                            index.setdefault(sound.type, []).append(
+                                (self._bitmask(sound.featureset), len(sound.featureset),
+                                 sound))
+                    self._nearest = index
+        return self._nearest
+
+    def nearest(self, sound, k=5, same_type=True, same_manner=False):
+        """
+        Find the sounds of the system which are most similar to a sound.
+
+        :param sound: A sound - possibly of another system - or a string which can be \
+        resolved to a sound.
+        :param same_type: Only consider sounds of the same type.
+        :param same_manner: Only consider sounds of the same manner (for consonants).
+        :return: `list` of up to `k` pairs (sound, similarity), most similar first. \
+        Similarities are computed as in `Sound.similarity`.
+        """
+        if not isinstance(sound, Symbol):  # noqa: F405
+            sound = self[sound]
+        if not isinstance(sound, Sound):  # noqa: F405
+            raise ValueError('no features for {0}'.format(sound))
+        index = self._nearest_index
+        candidates = index.get(sound.type, []) if same_type else [
+            item for type_ in sorted(index) for item in index[type_]]
+        if same_manner:
+            manner = getattr(sound, 'manner', None)
+            candidates = [c for c in candidates if getattr(c[2], 'manner', None) == manner]
+        mask, size = self._bitmask(sound.featureset), len(sound.featureset)
+        scored = []
+        for cmask, csize, csound in candidates:
+            common = popcount(cmask & mask)
+            scored.append((csound, common / (csize + size - common)))
+        return heapq.nlargest(k, scored, key=lambda item: item[1])
 
     def __contains__(self, item):
         if isinstance(item, Sound):  # noqa: F405
@@ -1,34 +1,125 @@
 """Auxiliary functions for pyclts."""
 
+import threading
 import unicodedata
-from collections import defaultdict
+from collections import defaultdict, Counter
 from pathlib import Path
 
 from csvw.dsv import reader
 
-__all__ = ['EMPTY', 'UNKNOWN', 'pkg_path', 'norm', 'nfd']
+__all__ = ['EMPTY', 'UNKNOWN', 'pkg_path', 'norm', 'nfd', 'registry']
 
 EMPTY = "◌"
 UNKNOWN = "�"
+# Maximal number of graphemes added to a translation table after it has been compiled:
+TRANSLATION_TABLE_SIZE = 2 ** 16
 
 
-class TranscriptionBase(object):
+class Registry(object):
+    """
+    The instances of transcription systems, data and sound classes, by (class, ID).
+
+    Instances are created when they are first requested and then shared, to avoid reading
+    the instance data from disk repeatedly. Creating an instance is protected by a lock per
+    (class, ID), so concurrent requests for the same instance load it only once, and an
+    instance is only registered - i.e. visible to other threads - once it is initialized.
+    """
+    def __init__(self):
+        self._instances = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(cls, id_):
+        return cls.__name__, id_
+
+    def get(self, cls, id_, *args, **kw):
+        """
+        Return the instance of `cls` with ID `id_`, creating it if necessary.
+
+        Additional arguments are passed to `__init__`, which is also called for existing
+        instances, e.g. to change the cache size of a transcription system.
+        """
+        key = self._key(cls, id_)
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.RLock())
+        with lock:
+            instance = self._instances.get(key)
+            if instance is None:
+                instance = object.__new__(cls)
+                instance.id = id_
+                # Guards the data structures an instance compiles lazily:
+                instance._lock = threading.RLock()
+                instance.__init__(id_, *args, **kw)
+                self._instances[key] = instance
+            else:
+                instance.__init__(id_, *args, **kw)
+        return instance
+
+    def preload(self, cls, ids, **kw):
+        """
+        Load instances and the data they would otherwise compile upon first use.
+
+        Preloading the instances used by a multi-threaded program before starting the
+        threads makes sure the threads only read shared data.
+
+        :return: `list` of instances.
+        """
+        res = []
+        for id_ in ids:
+            instance = self.get(cls, id_, **kw)
+            instance._preload()
+            res.append(instance)
+        return res
+
+    def evict(self, cls=None, id_=None):
+        """
+        Remove instances from the registry, so they are re-created upon the next request.
+
+        Instances which are still referenced elsewhere remain usable.
+
+        :param cls: Only evict instances of this class.
+        :param id_: Only evict instances with this ID.
+        :return: Number of evicted instances.
+        """
+        with self._lock:
+            keys = [
+                key for key in self._instances
+                if (cls is None or key[0] == cls.__name__) and (id_ is None or key[1] == id_)]
+            for key in keys:
+                del self._instances[key]
+        return len(keys)
+
+    def __contains__(self, item):
+        return self._key(*item) in self._instances
+
+
+registry = Registry()
+
+
+class _Registered(type):
+    def __call__(cls, id_, *args, **kw):
+        return registry.get(cls, id_, *args, **kw)
+
+
+class TranscriptionBase(object, metaclass=_Registered):
+    #
+    # This base class makes sure only one instance per (sub-class, id_) is created, see
+    # `Registry`. Since `__init__` is called for every request of an instance, derived
+    # classes must do the heavy-lifting in __init__ conditionally, i.e. check, whether the
+    # instance has been initialized before.
     #
-    # This base class makes sure only one instance per (sub-class, id_) is created.
-    # We do this to avoid re-reading the instance data from disk repeatedly. To make this
-    # work, derived classes must do the heavy-lifting in __init__ conditionally, i.e.
-    # check, whether the instance has been initialized before.
+    # Resolving sounds must not modify shared objects, so instances can be used from many
+    # threads. Data structures which are compiled lazily are either memos of deterministic
+    # values or built completely before being assigned, holding the instance's `_lock`.
+    # To rule out deadlocks, no other instance may be called while holding the lock.
     #
-    __instances = {}
+    # Types of output supported by `resolve_many`:
+    _outputs = ('sound', 'grapheme')
 
-    def __new__(cls, id_, **kw):
-        key = (cls.__name__, id_)
-        if key not in cls.__instances:
-            # Only create a new instance if the combination (cls, id_) hasn't been seen
-            # before.
-            cls.__instances[key] = object.__new__(cls)
-        cls.__instances[key].id = id_
-        return cls.__instances[key]
+    def _preload(self):
+        """Compile the data structures which are otherwise compiled lazily."""
+        pass
 
     def resolve_sound(self, sound):
         raise NotImplementedError  # pragma: no cover
@@ -47,11 +138,246 @@ class TranscriptionBase(object):
             return default
 
     def __call__(self, sounds, default="0"):
-        return [self.get(x, default=default) for x in sounds.split()]
+        return self.resolve_many(sounds.split(), default=default)
+
+    def translate(self, string, target_system, nearest=False):
+        """
+        Translate a string of space separated sounds into another system.
+
+        :param nearest: If `True` and `target_system` is a transcription system, sounds \
+        which are missing from the target are translated to the most similar sound of \
+        the target.
+        """
+        return ' '.join(t or '?' for t in self.translation_table(
+            target_system, nearest=nearest).translate_many([string])[0])
+
+    def translation_table(self, target_system, nearest=False):
+        """
+        Return the `TranslationTable` from this system into `target_system`.
+
+        Tables are compiled once per pair of systems and then kept with the source system.
+        """
+        key = (target_system.__class__.__name__, target_system.id, nearest)
+        table = self.__dict__.get('_translation_tables', {}).get(key)
+        if table is None:
+            # Compiling the table resolves sounds of the target, thus we must not hold our
+            # lock, but only to publish the table:
+            table = TranslationTable(self, target_system, nearest=nearest)
+            with self._lock:
+                tables = dict(self.__dict__.get('_translation_tables', {}))
+                table = tables.setdefault(key, table)
+                self._translation_tables = tables
+        return table
+
+    def translate_many(self, words, target_system, nearest=False, default=None, misses=None):
+        """
+        Translate a wordlist into another system, see `TranslationTable.translate_many`.
+        """
+        return self.translation_table(target_system, nearest=nearest).translate_many(
+            words, default=default, misses=misses)
 
-    def translate(self, string, target_system):
-        return ' '.join('{0}'.format(
-            target_system.get(self[s].name or '?', '?')) for s in string.split())
+    def resolve_many(self, sounds, output='sound', default=None, lazy=False, counts=None):
+        """
+        Resolve a sequence of sounds, resolving each distinct item only once.
+
+        :param sounds: Iterable of items which can be passed to `resolve_sound`.
+        :param output: What to return for known sounds: `sound` for the result of \
+        `resolve_sound`, `grapheme` for its string representation or `name` for the sound \
+        name (transcription systems only).
+        :param default: Returned for unknown sounds - like for `get`, unknown sounds are \
+        returned if `default` is `None`.
+        :param lazy: Return a generator rather than a `list`.
+        :param counts: `collections.Counter`, updated with the number of `tokens`, \
+        `distinct` items, `unknown` tokens and `unknown_distinct` items, once all sounds \
+        have been resolved. Only strings are told apart, i.e. other items are counted as \
+        distinct.
+        """
+        if output not in self._outputs:
+            raise ValueError('unsupported output: {0}'.format(output))
+        res = self._iter_resolved(
+            sounds, output, default, Counter() if counts is None else counts)
+        return res if lazy else list(res)
+
+    def _resolve_one(self, sound, output, default):
+        try:
+            res = self[sound]
+        except (KeyError, ValueError):
+            # Names which can't be resolved raise a ValueError.
+            res = None
+        is_unknown = res is None or getattr(res, 'type', None) == 'unknownsound'
+        if is_unknown and (default or res is None):
+            res = default
+        elif output == 'grapheme':
+            res = str(res)
+        elif output == 'name':
+            res = res.name
+        return res, is_unknown
+
+    def _iter_resolved(self, sounds, output, default, counts):
+        resolved, tokens, unknown = {}, 0, 0
+        # Items other than strings - e.g. unhashable symbols - are resolved one by one:
+        other, other_unknown = 0, 0
+        for sound in sounds:
+            if isinstance(sound, str):
+                if sound not in resolved:
+                    resolved[sound] = self._resolve_one(sound, output, default)
+                res, is_unknown = resolved[sound]
+            else:
+                res, is_unknown = self._resolve_one(sound, output, default)
+                other += 1
+                other_unknown += is_unknown
+            tokens += 1
+            if is_unknown:
+                unknown += 1
+            yield res
+        counts.update(
+            tokens=tokens,
+            distinct=len(resolved) + other,
+            unknown=unknown,
+            unknown_distinct=sum(1 for _, u in resolved.values() if u) + other_unknown)
+
+
+class TranslationTable(object):
+    """
+    Translations of sounds from a source into a target system, keyed by source grapheme.
+
+    Sounds are translated via their names. The table is compiled for all graphemes of the
+    source system upon creation. Other graphemes are added when they are translated - if
+    they are known sounds of the source, and at most `TRANSLATION_TABLE_SIZE` of them - so
+    tables of long-running processes don't grow without bounds. Since tables only store
+    strings, they can be pickled, e.g. to be sent to worker
+    processes, where the systems are re-loaded if graphemes must be added.
+    """
+    def __init__(self, source, target, nearest=False):
+        """
+        :param nearest: Translate sounds which are missing from a target transcription \
+        system to the most similar sound of the target.
+        """
+        self.source, self.target, self.nearest = source, target, nearest
+        self.table, self.size = {}, None
+        for grapheme in getattr(source, 'sounds', {}):
+            if isinstance(grapheme, str):
+                self.translate(grapheme)
+        self.size = len(self.table) + TRANSLATION_TABLE_SIZE
+
+    def __getstate__(self):
+        return dict(
+            source=(self.source.__class__, self.source.id),
+            target=(self.target.__class__, self.target.id),
+            nearest=self.nearest,
+            table=self.table,
+            size=self.size)
+
+    def __setstate__(self, state):
+        self.source = state['source'][0](state['source'][1])
+        self.target = state['target'][0](state['target'][1])
+        self.nearest, self.table, self.size = state['nearest'], state['table'], state['size']
+
+    def _translate(self, sound):
+        """
+        :return: pair (grapheme in the target or `None`, `bool` signaling whether `sound` \
+        is a known sound of the source).
+        """
+        try:
+            sound = self.source[sound]
+        except (KeyError, ValueError):
+            return None, False
+        known = getattr(sound, 'type', None) != 'unknownsound'
+        name, res = getattr(sound, 'name', None), None
+        if name:
+            try:
+                res = self.target[name]
+            except (KeyError, ValueError, TypeError):
+                # Features of the source may be unknown to or invalid in the target.
+                pass
+        if res is None or getattr(res, 'type', None) == 'unknownsound':
+            res = None
+            if self.nearest and hasattr(self.target, 'nearest') and \
+                    getattr(sound, 'type', None) in ('consonant', 'vowel', 'tone'):
+                matches = self.target.nearest(sound, k=1)
+                if matches:
+                    res = matches[0][0]
+        return None if res is None else '{0}'.format(res), known
+
+    def translate(self, sound):
+        """
+        :return: The grapheme of `sound` in the target system or `None`.
+        """
+        if isinstance(sound, str) and sound in self.table:
+            return self.table[sound]
+        res, known = self._translate(sound)
+        if isinstance(sound, str) and known and \
+                (self.size is None or len(self.table) < self.size):
+            self.table[sound] = res
+        return res
+
+    def translate_many(self, words, default=None, misses=None):
+        """
+        Translate a wordlist.
+
+        :param words: Iterable of words, given as strings of whitespace separated sounds \
+        or sequences of sounds.
+        :param default: Returned for sounds which cannot be translated.
+        :param misses: `collections.Counter`, updated with the sounds which cannot be \
+        translated.
+        :return: `list` of translated words, i.e. lists of graphemes.
+        """
+        res = []
+        for word in words:
+            translated = []
+            for sound in (word.split() if isinstance(word, str) else word):
+                target = self.translate(sound)
+                if target is None:
+                    if misses is not None:
+                        misses.update(['{0}'.format(sound)])
+                    target = default
+                translated.append(target)
+            res.append(translated)
+        return res
+
+
+class Trie(object):
+    """
+    A prefix tree of strings, used to find the longest known grapheme at a position.
+    """
+    def __init__(self, strings=()):
+        self._root = {}
+        for string in strings:
+            self.add(string)
+
+    def add(self, string):
+        node = self._root
+        for char in string:
+            node = node.setdefault(char, {})
+        # Mark the end of a string with the key `None`:
+        node[None] = True
+
+    def longest(self, string, start=0):
+        """
+        Return the length of the longest string in the trie starting at `string[start:]`.
+        """
+        node, length = self._root, 0
+        for i in range(start, len(string)):
+            node = node.get(string[i])
+            if node is None:
+                break
+            if None in node:
+                length = i - start + 1
+        return length
+
+    def finditer(self, string):
+        """
+        Yield (start, end) pairs of non-overlapping longest matches, scanning from left to
+        right - like `re.finditer` with an alternation of all strings sorted by length.
+        """
+        i = 0
+        while i < len(string):
+            length = self.longest(string, i)
+            if length:
+                yield i, i + length
+                i += length
+            else:
+                i += 1
 
 
 def pkg_path(*comps):
@@ -62,8 +388,21 @@ def norm(string):
     return string.replace(EMPTY, "")
 
 
-def nfd(string):
-    return unicodedata.normalize("NFD", string)
+if hasattr(str, 'isascii'):  # Python >= 3.7
+    def nfd(string):
+        # ASCII strings are NFD normalized already.
+        return string if string.isascii() else unicodedata.normalize("NFD", string)
+else:  # pragma: no cover
+    def nfd(string):
+        return unicodedata.normalize("NFD", string)
+
+
+if hasattr(int, 'bit_count'):  # Python >= 3.10
+    def popcount(i):
+        return i.bit_count()
+else:  # pragma: no cover
+    def popcount(i):
+        return bin(i).count('1')
 
 
 def itertable(table):
@@ -78,15 +417,25 @@ def itertable(table):
 
 
 def read_data(folder, fname, grapheme_col, *cols):
+    """
+    Read a table mapping graphemes to BIPA sounds.
+
+    Only the columns passed as `cols` are copied into the per-grapheme dicts.
+    """
     data, sounds, names = defaultdict(list), [], []
 
-    for row in reader(pkg_path(folder, fname), delimiter='\t', dicts=True):
-        grapheme = {"grapheme": row[grapheme_col]}
-        for col in cols:
-            grapheme[col.lower()] = row[col]
-        data[row['BIPA_GRAPHEME']].append(grapheme)
-        data[row['CLTS_NAME']].append(grapheme)
-        sounds.append(row['BIPA_GRAPHEME'])
-        names.append(row['CLTS_NAME'])
+    rows = reader(pkg_path(folder, fname), delimiter='\t')
+    header = next(rows)
+    gindex, bindex, nindex = [
+        header.index(col) for col in [grapheme_col, 'BIPA_GRAPHEME', 'CLTS_NAME']]
+    indices = [(col.lower(), header.index(col)) for col in cols]
+    for row in rows:
+        grapheme = {"grapheme": row[gindex]}
+        for col, index in indices:
+            grapheme[col] = row[index]
+        data[row[bindex]].append(grapheme)
+        data[row[nindex]].append(grapheme)
+        sounds.append(row[bindex])
+        names.append(row[nindex])
 
     return data, sounds, names
@@ -0,0 +1,85 @@
+import os
+import sys
+import subprocess
+from pathlib import Path
+
+import attr
+
+from pyclts.transcriptionsystem import TranscriptionSystem
+from pyclts import cache
+
+
+def test_snapshot(bipa, tmpdir, monkeypatch):
+    monkeypatch.setenv('PYCLTS_CACHE_DIR', str(tmpdir))
+    ts = object.__new__(TranscriptionSystem)
+    assert not cache.load_snapshot(ts, 'bipa')
+
+    assert cache.write_snapshot(bipa).exists()
+    assert cache.load_snapshot(ts, 'bipa')
+    assert set(ts.sounds) == set(bipa.sounds)
+    assert all(s.ts is ts for s in ts.sounds.values())
+    ts.id = 'bipa'
+    ts.clear_cache(100)
+    for grapheme in ['dʷʱ', 'ae', 'tk', 'zz', '_']:
+        assert ts[grapheme].name == bipa[grapheme].name
+        assert str(ts[grapheme]) == str(bipa[grapheme])
+
+    # A snapshot for different data must not be loaded:
+    monkeypatch.setattr(cache, 'system_hash', lambda id_: 'x')
+    assert not cache.load_snapshot(object.__new__(TranscriptionSystem), 'bipa')
+
+
+def test_snapshot_hashes(tmpdir, monkeypatch):
+    # Hashes of strings differ between processes, thus must not be stored in snapshots:
+    monkeypatch.setenv('PYCLTS_CACHE_DIR', str(tmpdir))
+    subprocess.check_call(
+        [sys.executable, '-c', """\
+from pyclts import TranscriptionSystem, cache
+ts = TranscriptionSystem('bipa')
+set(s for s in ts.sounds.values() if s.type != 'marker')
+cache.write_snapshot(ts)"""],
+        env=dict(
+            os.environ,
+            PYTHONHASHSEED='2' if os.environ.get('PYTHONHASHSEED') == '1' else '1'))
+    ts = object.__new__(TranscriptionSystem)
+    assert cache.load_snapshot(ts, 'bipa')
+    sound = ts.sounds['a']
+    assert attr.evolve(sound, source='zzz') in {sound}
+
+
+def test_ParseCache(bipa, tmpdir, monkeypatch):
+    pc = cache.ParseCache(str(tmpdir.join('parses.sqlite')))
+    bipa.set_parse_cache(pc)
+    for grapheme in ['dʱʷ', 'ʰdʱ', 'ˈa', 'zz', 'ae', 'a']:
+        sound = bipa[grapheme]
+        cached = cache.ParseCache(pc.path).get(bipa, grapheme)
+        if sound.type == 'unknownsound' or (sound.generated and sound.type != 'diphthong'):
+            assert attr.asdict(cached, filter=lambda a, v: a.init) == \
+                attr.asdict(sound, filter=lambda a, v: a.init)
+        else:
+            assert cached is None
+    bipa.clear_cache()
+    assert bipa['ʰdʱ'].generated
+
+    monkeypatch.setattr(cache, 'system_hash', lambda id_: 'x')
+    assert cache.ParseCache(pc.path).get(bipa, 'ʰdʱ') is None
+    pc.clear()
+    bipa.set_parse_cache(None)
+
+
+def test_generated(bipa, tmpdir, monkeypatch):
+    # The table shipped with the package must be up to date:
+    assert cache.load_generated('bipa')
+    assert not cache.verify_generated(bipa)
+    sound = bipa._generated_sound('kʰʷ')
+    assert sound.generated and sound.alias and str(sound) == 'kʷʰ'
+    assert bipa._generated_sound('zz') is None
+
+    monkeypatch.setattr(cache, 'generated_path', lambda id_: Path(str(tmpdir)) / 'g.tsv')
+    assert cache.write_generated(bipa, ['a', 'dʱʷ', 'ʰdʱ', 'zz', 'ae', 'kʰʷ']) == 3
+    assert set(cache.load_generated('bipa')) == {'dʱʷ', 'ʰdʱ', 'kʰʷ'}
+    assert not cache.verify_generated(bipa)
+    # Tables for different data are ignored:
+    monkeypatch.setattr(cache, 'system_hash', lambda id_: 'x')
+    assert cache.load_generated('bipa') == {}
+    bipa._generated = None
@@ -1,6 +1,13 @@
+import io
+import csv
+import json
 from pathlib import Path
 
-from pyclts.__main__ import sounds, dump, dstats, stats, table, _make_app_data, features
+import pytest
+
+from pyclts.__main__ import (
+    sounds, dump, dstats, stats, table, _make_app_data, features, build_cache, coverage,
+    transcribe)
 from pyclts.api import CLTS
 
 
@@ -18,20 +25,20 @@ def test_stats(capsys, mocker, tmpdir):
 
 
 def test_sounds_cmd(capsys, mocker):
-    sounds(mocker.Mock(system='bipa', args=['a', 'kh', 'zz']))
+    sounds(mocker.Mock(system='bipa', socket=None, args=['a', 'kh', 'zz']))
     out, err = capsys.readouterr()
     assert 'kʰ' in out
 
 
 def test_table(capsys, mocker):
-    table(mocker.Mock(system='bipa', args=['a', 'kh', 'zz']))
+    table(mocker.Mock(system='bipa', socket=None, args=['a', 'kh', 'zz']))
     out, err = capsys.readouterr()
     assert '# vowel' in out
     assert '# consonant' in out
     assert '# Unknown sounds' in out
-    table(mocker.Mock(system='bipa', args=['a', 'kh', 'zz'], filter='unknown'))
-    table(mocker.Mock(system='bipa', args=['a', 'kh', 'zz'], filter='known'))
-    table(mocker.Mock(system='bipa', args=['a', 'kh', 'zz'], filter='generated'))
+    table(mocker.Mock(system='bipa', socket=None, args=['a', 'kh', 'zz'], filter='unknown'))
+    table(mocker.Mock(system='bipa', socket=None, args=['a', 'kh', 'zz'], filter='known'))
+    table(mocker.Mock(system='bipa', socket=None, args=['a', 'kh', 'zz'], filter='generated'))
 
 
 def test_make_app_data(capsys, mocker, tmpdir):
@@ -48,3 +55,60 @@ def test_dump(capsys, mocker, tmpdir):
     stats(mocker.Mock(repos=CLTS(str(tmpdir))))
     out, err = capsys.readouterr()
     assert 'Unique graphemes' in out
+
+
+def test_build_cache(mocker, tmpdir, monkeypatch):
+    monkeypatch.setenv('PYCLTS_CACHE_DIR', str(tmpdir))
+    build_cache(mocker.Mock(repos=CLTS(str(tmpdir))))
+    assert Path(str(tmpdir)).joinpath('bipa.pickle').exists()
+    assert Path(str(tmpdir)).joinpath('graphemes.pickle').exists()
+
+
+def test_coverage(capsys, mocker, tmpdir):
+    pytest.importorskip('numpy')
+
+    coverage(mocker.Mock(repos=CLTS(str(tmpdir))))
+    out, err = capsys.readouterr()
+    assert 'ruhlen' in out and '1.00' in out
+
+
+def test_transcribe(capsys, mocker, tmpdir, monkeypatch):
+    fname = tmpdir.join('words.csv')
+    fname.write_text('ID,Segments\n1,th a\n2,zz a +\n', encoding='utf8')
+    transcribe(mocker.Mock(
+        system='bipa', args=[str(fname)], column='Segments', output='tsv', jobs=1))
+    out, err = capsys.readouterr()
+    lines = out.splitlines()
+    assert lines[0].split('\t')[-3:] == ['CLTS_GRAPHEMES', 'CLTS_NAMES', 'CLTS_UNKNOWN']
+    assert lines[1].split('\t')[2] == 'tʰ a'
+    assert lines[2].split('\t')[-1] == '1 0 0'
+
+    monkeypatch.setattr('sys.stdin', io.StringIO('ID\tSegments\n1\tth a\n'))
+    monkeypatch.setattr('pyclts.__main__.CHUNK_SIZE', 1)
+    transcribe(mocker.Mock(system='bipa', args=[], column='Segments', output='jsonl', jobs=2))
+    out, err = capsys.readouterr()
+    item = json.loads(out.splitlines()[0])
+    assert item['ID'] == '1' and item['CLTS_UNKNOWN'] == [False, False]
+    assert item['CLTS_NAMES'][1] == 'unrounded open front vowel'
+
+    transcribe(mocker.Mock(
+        system='bipa', args=[str(fname)], column='Segments', output='csv', jobs=1))
+    out, err = capsys.readouterr()
+    lines = list(csv.reader(io.StringIO(out)))
+    assert lines[0] == ['ID', 'Segments', 'CLTS_GRAPHEMES', 'CLTS_NAMES', 'CLTS_UNKNOWN']
+    assert lines[1][:3] == ['1', 'th a', 'tʰ a'] and len(lines) == 3
+
+    with pytest.raises(ValueError):
+        transcribe(mocker.Mock(system='bipa', args=[str(fname)], column='X', output='csv', jobs=1))
+
+    # Quotes are not special in TSV, and rows without segments are kept:
+    fname = tmpdir.join('words.tsv')
+    fname.write_text('Form\tSegments\n"x\tth\n\ny\na\ta\n', encoding='utf8')
+    transcribe(mocker.Mock(
+        system='bipa', args=[str(fname)], column='Segments', output='tsv', jobs=1))
+    out, err = capsys.readouterr()
+    assert [line.split('\t') for line in out.splitlines()[1:]] == [
+        ['"x', 'th', 'tʰ', 'aspirated voiceless alveolar stop consonant', '0'],
+        ['', '', ''],
+        ['y', '', '', ''],
+        ['a', 'a', 'a', 'unrounded open front vowel', '0']]
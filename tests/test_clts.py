@@ -1,6 +1,8 @@
+import attr
 import pytest
 
 from pyclts.models import Marker, UnknownSound, is_valid_sound, Symbol, Sound
+from pyclts.transcriptiondata import TranscriptionData
 
 
 def test_is_valid_sound(bipa):
@@ -271,3 +273,107 @@ def test_sounds(
             assert sound.stress
         assert sound.name == name
         assert sound.codepoints == codepoints
+
+
+def test_transcriptiondata_columns():
+    td = TranscriptionData('ruhlen', columns=['GRAPHEME'])
+    assert td.data['m'][0]['grapheme'] == 'm'
+    td = TranscriptionData('ruhlen', columns=['COUNT'])
+    assert 'count' in td.data['m'][0]
+    assert 'latex' not in td.data['m'][0]
+    # Requesting fewer columns from a loaded instance does not trigger re-reading:
+    assert TranscriptionData('ruhlen', columns=[]).data['m'][0]['count'] == '2044'
+
+    with pytest.raises(ValueError):
+        TranscriptionData('ruhlen', columns=['XYZ'])
+    with pytest.raises(ValueError):
+        TranscriptionData('xyz')
+
+
+def test_grapheme_index(tmpdir, monkeypatch):
+    from pyclts.transcriptiondata import grapheme_index
+
+    monkeypatch.setenv('PYCLTS_CACHE_DIR', str(tmpdir))
+    grapheme_index.cache_clear()
+    index = grapheme_index()
+    assert index['!ʰ']['ruhlen'] == 'ǃʰ'
+    assert tmpdir.join('graphemes.pickle').check()
+    grapheme_index.cache_clear()
+    assert grapheme_index() == index
+
+    td = TranscriptionData('ruhlen')
+    assert td.to_bipa('!ʰ') == 'ǃʰ'
+    with pytest.raises(KeyError):
+        td.to_bipa('!ˣ')
+    with pytest.raises(KeyError):
+        td.to_bipa('xyz')
+    grapheme_index.cache_clear()
+
+    # Failing to write the cache must not break lookups:
+    tmpdir.join('file').write('')
+    monkeypatch.setenv('PYCLTS_CACHE_DIR', str(tmpdir.join('file', 'cache')))
+    assert td.to_bipa('!ʰ') == 'ǃʰ'
+    grapheme_index.cache_clear()
+
+
+def test_segment(bipa):
+    assert [str(s) for s in bipa.segment('tʰɔxtər')] == ['tʰ', 'ɔ', 'x', 't', 'ə', 'r']
+    assert [str(s) for s in bipa.segment('tsaŋ kʷʰa')] == ['ts', 'a', 'ŋ', 'kʷʰ', 'a']
+    assert bipa.segment('ʰda')[0].name == bipa['ʰd'].name
+    assert bipa.segment('kʰʷ')[0].alias
+    assert bipa.segment('a*')[1].type == 'unknownsound'
+    assert bipa.segment('') == []
+
+
+def test_cache(bipa):
+    import attr
+
+    sound = bipa['ts']
+    assert bipa['ʦ'].grapheme == 'ʦ'
+    assert sound.source == bipa.sounds['ts'].source == 'ts'
+    with pytest.raises(attr.exceptions.FrozenInstanceError):
+        sound.source = 'x'
+
+    bipa.clear_cache(10)
+    assert bipa['zz'] is bipa['zz']
+    assert bipa.cache_info().hits == 1
+    TranscriptionData('ruhlen').prewarm(limit=5)
+    assert bipa.cache_info().currsize == 6
+    bipa.clear_cache(2 ** 16)
+
+
+def test_normalize(bipa):
+    assert bipa.normalize('ε') == 'ɛ'
+    assert bipa.normalize('ɡa') == 'ga'
+    assert bipa.normalize('ã') == 'ã'
+
+
+def test_from_names(bipa):
+    name = 'pre-aspirated voiced bilabial nasal consonant'
+    sounds = bipa.from_names([name, 'voiced nasal bilabial consonant', 'xyz consonant', name])
+    assert sounds[0].generated and sounds[0] is sounds[3]
+    assert sounds[1] is bipa['m']
+    assert sounds[2] is None
+    assert bipa.from_names(['bilabial pre-aspirated voiced nasal consonant'])[0] is sounds[0]
+    # Memoized names must not change which names are valid:
+    with pytest.raises(ValueError):
+        bipa._from_name('consonant pre-aspirated voiced bilabial nasal')
+
+
+def test_str(bipa):
+    sound = bipa['ʰdʱ']
+    assert str(sound) == sound.s == 'ʰdʱ'
+    assert sound._s == 'ʰdʱ'
+    # Copies with different features are rendered from scratch:
+    assert str(attr.evolve(sound, preceding=None)) == 'dʱ'
+    assert bipa._base_grapheme(('voiced', 'alveolar', 'stop', 'consonant'), None)[0] == 'd'
+
+
+def test_shared_sounds(bipa):
+    sound = bipa['dʱʷ']
+    assert sound.name is sound.name and hash(sound) == hash(sound.name)
+    assert sound.featureset is sound.featureset
+    assert not hasattr(sound, '__dict__')
+    # Sounds dropped from the LRU cache are still shared while in use:
+    bipa._cache.cache_clear()
+    assert bipa['dʱʷ'] is sound
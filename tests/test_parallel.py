@@ -0,0 +1,16 @@
+from pyclts.parallel import resolve_corpus
+
+
+def test_resolve_corpus(bipa):
+    words = ['th a', ['zz', 'a'], '', 'ʰdʱ a'] * 5
+    expected = [
+        [(str(bipa[s]), bipa[s].name, bipa[s].type == 'unknownsound') for s in word]
+        for word in (w.split() if isinstance(w, str) else w for w in words)]
+    assert list(resolve_corpus(words, jobs=1, chunk_size=3)) == expected
+    assert list(resolve_corpus(iter(words), jobs=2, chunk_size=3)) == expected
+    assert list(resolve_corpus([], jobs=2)) == []
+
+    # Segments which can't be resolved are reported as unknown:
+    for jobs in [1, 2]:
+        assert list(resolve_corpus([['a', 'cluster']], jobs=jobs)) == [
+            [('a', bipa['a'].name, False), ('cluster', None, True)]]
@@ -0,0 +1,78 @@
+import json
+import socket
+import threading
+
+import pytest
+
+from pyclts import server
+from pyclts.__main__ import sounds, table
+
+
+@pytest.fixture
+def daemon(tmpdir):
+    path = str(tmpdir.join('pyclts.sock'))
+    srv = server.make_server(path, resolver=server.Resolver(soundclasses=['sca']))
+    thread = threading.Thread(target=srv.serve_forever)
+    thread.start()
+    yield path
+    srv.shutdown()
+    srv.server_close()
+    thread.join()
+
+
+def test_Resolver(bipa):
+    resolver = server.Resolver(soundclasses=[])
+    responses = resolver.handle_many([
+        dict(id=1, op='resolve', sounds=['kh', 'a', 'zz', 1]),
+        dict(op='batch', requests=[dict(op='resolve', sounds=['a']), dict(op='xyz')]),
+        dict(op='translate', words=['t a', 'zz'], target='asjpcode'),
+        dict(op='translate', words=['t a'], target='asjpcode', kind='xyz'),
+        dict(op='soundclass', model='sca', sounds=['kh', 'zz']),
+        dict(op='resolve', system='xyz', sounds=['a']),
+        None,
+    ])
+    assert responses[0]['id'] == 1 and 'error' in responses[0]
+    assert responses[1]['result'][0]['result'][0] == server.sound_as_dict(bipa['a'])
+    assert 'unknown op' in responses[1]['result'][1]['error']
+    assert responses[2]['result'] == [['t', 'E'], [None]]
+    assert 'unknown kind' in responses[3]['error']
+    assert responses[4]['result'] == ['K', '0']
+    assert 'unknown system' in responses[5]['error']
+    assert responses[6] == dict(error='invalid request')
+
+    kh, zz = resolver.handle(dict(op='resolve', sounds=['kh', 'zz']))['result']
+    assert kh['s'] == 'kʰ' and kh['name'] == bipa['kh'].name and kh['table']
+    assert zz['type'] == 'unknownsound' and zz['name'] is None
+
+
+def test_daemon(daemon, capsys, mocker):
+    assert server.connect(daemon + 'x') is None
+    with pytest.raises(ValueError):
+        server.make_server(daemon)
+
+    with server.Client(daemon) as client:
+        assert client.request('soundclass', model='sca', sounds=['a'])[0] == 'A'
+        with pytest.raises(ValueError):
+            client.request('translate', words=['a'], target='xyz')
+        # Requests are pipelined and answered in order:
+        responses = client.requests(
+            [dict(id=i, op='resolve', sounds=['a', 'kh'][i % 2:]) for i in range(100)])
+        assert [r['id'] for r in responses] == list(range(100))
+        assert responses[1]['result'][0]['s'] == 'kʰ'
+
+    # Requests may arrive in pieces:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(daemon)
+        request = json.dumps(dict(op='resolve', sounds=['th'])).encode('utf8') + b'\n'
+        sock.sendall(request[:10])
+        sock.sendall(request[10:])
+        assert json.loads(sock.makefile('rb').readline().decode('utf8'))['result'][0]['s'] \
+            == 'tʰ'
+
+    for cmd in [sounds, table]:
+        out = []
+        for path in [str(daemon) + 'x', daemon]:
+            cmd(mocker.Mock(
+                system='bipa', socket=path, args=['a', 'kh', 'zz'], filter='', format='pipe'))
+            out.append(capsys.readouterr()[0])
+        assert 'kʰ' in out[0] and out[0] == out[1]
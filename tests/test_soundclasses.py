@@ -0,0 +1,31 @@
+import pytest
+
+from pyclts.soundclasses import convert, SoundClasses, SOUNDCLASS_SYSTEMS
+
+
+def test_convert(bipa, sca, dolgo):
+    pytest.importorskip('numpy')
+
+    corpus = ['tʰ ɔ x', ['ˈth', 'ə', 'r'], 'A ˈI ʲ', [bipa['ae']]]
+    offsets, classes = convert(corpus, models=['sca', 'dolgo'])
+    assert list(offsets) == [0, 3, 6, 9, 10]
+    assert set(classes) == {'sca', 'dolgo'}
+    codes, alphabet = classes['dolgo']
+    assert codes.dtype.name == 'uint8'
+    assert ''.join(alphabet[c] for c in codes) == ''.join(dolgo('tʰ ɔ x ˈth ə r A ˈI ʲ')) + 'V'
+    codes, alphabet = classes['sca']
+    assert [alphabet[c] for c in codes[offsets[1]:offsets[2]]] == sca('ˈth ə r')
+    assert alphabet[0] == '0'
+
+
+def test_fallback(bipa, sca):
+    # The precomputed classes must match the classes computed by the fallback:
+    for sc in [SoundClasses(model) for model in SOUNDCLASS_SYSTEMS]:
+        for name, cls in list(sc._fallback.items())[:500]:
+            assert sc._resolve_fallback(bipa[name]) == cls
+    assert 'aspirated long voiceless velar stop consonant' not in sca.data
+    assert sca['kʰː'] == 'K'
+    sound = bipa['ʰdʱ']
+    sca.__dict__.pop('_fallback', None)
+    assert sca[sound] == 'T'
+    assert sound.name in sca._fallback
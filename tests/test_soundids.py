@@ -0,0 +1,51 @@
+import pytest
+
+from pyclts.soundids import (
+    SoundIDs, UNKNOWN_ID, save_corpus, load_corpus,
+    overlap_matrix, jaccard_matrix, feature_distance_matrix)
+
+
+def test_SoundIDs(bipa, tmpdir):
+    np = pytest.importorskip('numpy')
+
+    sids = SoundIDs('bipa')
+    n = len(sids)
+    assert sids.register('th') == sids.register(bipa['tʰ']) > UNKNOWN_ID
+    assert sids.register('zz') == UNKNOWN_ID
+    assert SoundIDs(bipa).version == sids.version
+
+    ids, offsets = sids.encode(['th a', ['dʱʷ', 'a'], 'zz'])
+    assert len(sids) == n + 1
+    assert ids.dtype == np.uint16
+    assert list(offsets) == [0, 2, 4, 5]
+    words = sids.decode(ids, offsets)
+    assert [str(s) for s in words[1]] == ['dʷʱ', 'a']
+    assert words[2] == [None]
+    assert sids.decode(ids[:2]) == words[0]
+
+    save_corpus(str(tmpdir.join('corpus')), sids, ids, offsets)
+    sids2, ids2, offsets2 = load_corpus(str(tmpdir.join('corpus')))
+    assert sids2.names == sids.names and sids2.version == sids.version
+    assert isinstance(ids2, np.memmap)
+    assert sids2.decode(ids2, offsets2) == words
+
+
+def test_inventories(bipa):
+    pytest.importorskip('numpy')
+
+    sids = SoundIDs(bipa)
+    inventories = [['p', 't', 'a', 'zz'], ['t', 'a', 'i'], ['pʰ', 'tʰ', 'a'], []]
+    matrix = sids.encode_inventories(inventories)
+    assert matrix.shape == (4, len(sids))
+    assert matrix.sum(axis=1).tolist() == [3, 3, 3, 0]
+
+    overlap = overlap_matrix(matrix)
+    assert overlap[0].tolist() == [3, 2, 1, 0]
+    jaccard = jaccard_matrix(matrix)
+    assert jaccard[0, 1] == 2 / 4 and jaccard[3, 3] == 0
+    assert (jaccard == jaccard.T).all()
+
+    distances = feature_distance_matrix(sids, matrix)
+    assert distances[0, 0] == 0
+    # Aspirated stops are closer to plain stops than to a vowel:
+    assert distances[0, 2] < distances[1, 2] <= 1
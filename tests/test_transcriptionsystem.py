@@ -14,3 +14,53 @@ def test_ts():
         TranscriptionSystem('_f3')
     with pytest.raises(ValueError):
         _ = TranscriptionSystem('what')
+
+
+def test_similarity_matrix(bipa):
+    pytest.importorskip('numpy')
+
+    sounds = ['tʰ', 'dʱʷ', 'a', 'ãː', 'ai', '˥']
+    matrix = bipa.feature_matrix(sounds)
+    assert matrix.shape == (len(sounds), len(bipa.feature_columns))
+    assert matrix[2].sum() == len(bipa['a'].featureset)
+    similarities = bipa.similarity_matrix(sounds, sounds[:2])
+    for i, s1 in enumerate(sounds):
+        for j, s2 in enumerate(sounds[:2]):
+            assert similarities[i, j] == bipa[s1].similarity(bipa[s2])
+    assert bipa.feature_matrix().shape[0] == len(
+        [s for s in bipa.sounds.values() if s.type != 'marker' and not s.alias])
+    with pytest.raises(ValueError):
+        bipa.feature_matrix(['zz'])
+
+
+def test_nearest(bipa, asjp):
+    matches = bipa.nearest('dʱʷ', k=3)
+    assert len(matches) == 3
+    assert str(matches[0][0]) == 'dʱ'
+    assert matches[0][1] == bipa['dʱʷ'].similarity(matches[0][0])
+    assert matches[0][1] >= matches[1][1] >= matches[2][1]
+    assert all(s.type == 'consonant' and s.manner == 'stop' for s, _ in bipa.nearest(
+        'dʱʷ', k=10, same_manner=True))
+    assert bipa.nearest('a', k=1)[0] == (bipa['a'], 1.0)
+    assert asjp.nearest(bipa['t̼'], k=1)[0][0] in asjp.sounds.values()
+    with pytest.raises(ValueError):
+        bipa.nearest('zz')
+
+
+def test_query(bipa):
+    implosives = bipa.query(type='consonant', manner='implosive', phonation='voiced')
+    assert bipa['ɓ'] in implosives
+    assert all(s.manner == 'implosive' and s.phonation == 'voiced' for s in implosives)
+    assert [str(s) for s in bipa.query(
+        type='consonant', manner='implosive', exclude=dict(phonation='voiced'))] == ['ʛ̥']
+
+    vowels = bipa.query(duration='long', nasalization='nasalized', centrality='front')
+    assert vowels and all(s.type == 'vowel' and not s.alias for s in vowels)
+    assert len(bipa.query(type='vowel', duration=None)) + len(
+        bipa.query(type='vowel', duration={'long', 'ultra-long', 'mid-long', 'ultra-short'})
+    ) == len(bipa.query(type='vowel'))
+    assert len(bipa.query(manner='stop', aliases=True)) > len(bipa.query(manner='stop'))
+    assert not bipa.query(type='marker')
+    with pytest.raises(ValueError):
+        bipa.query(colour='red')
+    assert ('consonant', 'manner', 'implosive') in bipa.feature_values()
@@ -1,5 +1,123 @@
+import pickle
+import threading
+import collections
+import concurrent.futures
+
+import pytest
+
+from pyclts import util, cache, TranscriptionSystem, SoundClasses
+from pyclts.util import Trie, Registry
+
 
 def test_TranscriptionBase_translate(bipa, asjp, asjpd):
     assert bipa.translate('ts a', asjp) == 'c E'
     assert asjp.translate('c a', bipa) == 'ts ɐ'
     assert bipa.translate('t o h t a', asjpd)[0] == 't'
+    assert bipa.translate('t̼ a', asjp) == '? E'
+    assert bipa.translate('t̼ a', asjp, nearest=True) == '7 E'
+
+
+def test_TranslationTable(bipa, asjp, sca):
+    table = bipa.translation_table(asjp)
+    assert bipa.translation_table(asjp) is table
+    assert table.table['ts'] == 'c'
+    misses = collections.Counter()
+    assert table.translate_many(['ts a', ['t̼', 'zz']], misses=misses) == \
+        [['c', 'E'], [None, None]]
+    assert misses == {'t̼': 1, 'zz': 1}
+    assert bipa.translate_many(['t̼ a'], asjp, nearest=True, default='?') == [['7', 'E']]
+    assert bipa.translate_many([[bipa['a']]], sca) == [['A']]
+
+    table = pickle.loads(pickle.dumps(table))
+    assert table.source is bipa and table.table['ts'] == 'c'
+    assert 'kʰʷ' not in table.table
+    assert table.translate('kʰʷ') == 'kwh' and 'kʰʷ' in table.table
+    # Unknown sounds aren't stored, and the table doesn't grow beyond its size:
+    assert 'zz' not in table.table
+    table.size = len(table.table)
+    assert table.translate('dʱʷ') == table.translate('dʱʷ') and 'dʱʷ' not in table.table
+
+
+def test_Trie():
+    trie = Trie(['t', 'ts', 'a'])
+    assert trie.longest('tsa') == 2
+    assert trie.longest('tsa', 2) == 1
+    assert trie.longest('xa') == 0
+    assert list(trie.finditer('tsxta')) == [(0, 2), (3, 4), (4, 5)]
+
+
+def test_TranscriptionBase_resolve_many(bipa, sca):
+    counts = collections.Counter()
+    res = bipa.resolve_many(['th', 'a', 'th', 'zz', 'a'], output='grapheme', counts=counts)
+    assert res == ['tʰ', 'a', 'tʰ', 'zz', 'a']
+    assert counts == dict(tokens=5, distinct=3, unknown=1, unknown_distinct=1)
+    res = bipa.resolve_many(iter(['th', 'zz']), output='name', default='?', lazy=True)
+    assert not isinstance(res, list)
+    assert list(res) == ['aspirated voiceless alveolar stop consonant', '?']
+    assert bipa.resolve_many(['a', 'zz'])[1].type == 'unknownsound'
+    assert sca.resolve_many(['th', 'a', 'th']) == ['T', 'A', 'T']
+    assert sca('th a zz') == ['T', 'A', '0']
+    with pytest.raises(ValueError):
+        sca.resolve_many(['a'], output='name')
+
+    # Symbols are resolved, too, even if they can't be hashed:
+    counts = collections.Counter()
+    zz, plus = bipa['zz'], bipa['+']
+    assert bipa.resolve_many([zz, plus, 'a'], output='grapheme', counts=counts) == \
+        ['zz', '+', 'a']
+    assert counts == dict(tokens=3, distinct=3, unknown=1, unknown_distinct=1)
+    assert sca.resolve_many([zz, bipa['a']], default='0') == ['0', 'A']
+
+
+def test_Registry(bipa, mocker, monkeypatch):
+    monkeypatch.setattr(util, 'registry', Registry())
+    load_snapshot = mocker.patch(
+        'pyclts.transcriptionsystem.cache.load_snapshot', wraps=cache.load_snapshot)
+
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        systems = list(pool.map(TranscriptionSystem, ['bipa'] * 16))
+    # The system is loaded only once and shared by all threads:
+    assert load_snapshot.call_count == 1
+    assert all(ts is systems[0] for ts in systems)
+    assert systems[0] is not bipa
+    assert util.registry.get(TranscriptionSystem, 'bipa') is systems[0]
+    assert (TranscriptionSystem, 'bipa') in util.registry
+
+    # Failing instances are not registered:
+    with pytest.raises(ValueError):
+        TranscriptionSystem('xyz')
+    assert (TranscriptionSystem, 'xyz') not in util.registry
+
+    sca, = util.registry.preload(SoundClasses, ['sca'])
+    assert '_fallback' in sca.__dict__ and sca.system is systems[0]
+    assert util.registry.evict(TranscriptionSystem) == 1
+    assert (SoundClasses, 'sca') in util.registry
+    assert TranscriptionSystem('bipa') is not systems[0]
+    assert util.registry.evict() == 2
+
+
+def test_concurrent_lookups(bipa):
+    graphemes = ['tʰ', 'dʷʱ', 'ae', 'tk', 'zz', 'kʷʰ', 'ã', '_'] * 50
+    expected = [bipa[g].name for g in graphemes]
+    bipa.clear_cache()
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        for _ in range(4):
+            assert list(pool.map(lambda g: bipa[g].name, graphemes)) == expected
+    assert [s.name for s, _ in bipa.nearest(bipa['tʰ'])] == [
+        s.name for s, _ in bipa.nearest(bipa['tʰ'])]
+
+
+def test_concurrent_translation_tables(monkeypatch):
+    monkeypatch.setattr(util, 'registry', Registry())
+    bipa, gld = TranscriptionSystem('bipa'), TranscriptionSystem('gld')
+    barrier = threading.Barrier(2)
+
+    def compile_(source, target):
+        barrier.wait()
+        return source.translation_table(target)
+
+    with concurrent.futures.ThreadPoolExecutor(2) as pool:
+        futures = [pool.submit(compile_, bipa, gld), pool.submit(compile_, gld, bipa)]
+        tables = [f.result(timeout=60) for f in futures]
+    assert bipa.translation_table(gld) is tables[0]
+    assert gld.translation_table(bipa) is tables[1]